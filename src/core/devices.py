@@ -1,13 +1,13 @@
+import atexit
 import niswitch
 import pyvisa
-import contextlib
 from functools import lru_cache
 from abc import ABCMeta, abstractmethod
 import logging
-from typing import Optional, Dict
-from enum import Enum
+from typing import Optional, Dict, List, Tuple
+from enum import IntEnum
 import numpy as np
-from time import sleep
+from time import monotonic, sleep
 
 from core.utils import bidict, Config
 
@@ -16,6 +16,43 @@ class RequestError(Exception):
     pass
 
 
+@lru_cache(maxsize=1)
+def _get_resource_manager() -> pyvisa.ResourceManager:
+    """Get the VISA resource manager shared by all devices in this process
+
+    Creating a resource manager loads and scans the VISA backend, which is slow
+    on GPIB setups, so it is only done once and closed when the process exits.
+
+    Returns:
+        pyvisa.ResourceManager: The shared resource manager
+    """
+    rm = pyvisa.ResourceManager()
+    atexit.register(rm.close)
+    return rm
+
+
+# Seconds for which list_resources returns the result of the previous scan
+RESOURCE_CACHE_LIFETIME = 5.0
+_resource_cache: Optional[Tuple[float, List[str]]] = None
+
+
+def list_resources() -> List[str]:
+    """List the VISA resources connected to the computer
+
+    Scanning the GPIB bus can take seconds, so a scan is reused for
+    RESOURCE_CACHE_LIFETIME seconds.
+
+    Returns:
+        List[str]: The resource names
+    """
+    global _resource_cache
+    now = monotonic()
+    if _resource_cache is None or now - _resource_cache[0] >= RESOURCE_CACHE_LIFETIME:
+        resources = [str(r) for r in _get_resource_manager().list_resources()]
+        _resource_cache = (now, resources)
+    return list(_resource_cache[1])
+
+
 # region [Abstract Classes]
 
 
@@ -30,7 +67,7 @@ class AbstractDevice(metaclass=ABCMeta):
     """
 
     # Class Variables
-    _instances: Dict[str, "AbstractDevice"] = dict()
+    _instances: Dict[Tuple[type, Optional[str]], "AbstractDevice"] = dict()
 
     def __init__(self):
         self.logger = logging.getLogger(__name__)
@@ -52,13 +89,17 @@ class AbstractDevice(metaclass=ABCMeta):
         If the device is already created, then the instance will be returned. If the
         device is not created, then a new instance will be created. We treat every instance with a
         unique name as a separate instance. If the name is not provided, then the default
-        instance will be returned. The default instance is stored as 'default' in the class 
-        variable.
+        instance will be returned. The default instance is stored under the name None in
+        the class variable. Instances are kept per device class, so a mock and a real device
+        with the same name never shadow each other.
 
         We also provide an option to mock the device. If the mock flag is set to True, then
         a mock instance of the device will be returned. This is useful for testing the application
         without the actual hardware.
 
+        An existing instance is returned as is; ``mock`` and ``kwargs`` only apply
+        when the instance is first created.
+
         Args:
             name (Optional[str], optional): The name of the device. Defaults to None.
             mock (bool, optional): If the device should be mocked. Defaults to False.
@@ -66,17 +107,11 @@ class AbstractDevice(metaclass=ABCMeta):
         Returns:
             AbstractDevice: An instance of the device
         """
-        if name is not None:
-            # get the instance by name
-            instance = cls._instances.get(name, None)
-        else:
-            # get the default instance
-            instance = cls._instances.get("default", None, )
-        if instance is not None:
-            return instance
-        instance = cls(name, simulate=mock, **kwargs)
-        # store the instance as a class variable
-        cls._instances[name or "default"] = instance
+        key = (cls, name)
+        instance = cls._instances.get(key)
+        if instance is None:
+            # store the instance as a class variable
+            instance = cls._instances[key] = cls(name, simulate=mock, **kwargs)
         return instance
 
 
@@ -98,6 +133,27 @@ class AbstractSourceMeter(AbstractDevice):
     @abstractmethod
     def configure_output(self) -> None: ...
 
+    def measure_current_avg(self, n: int, nplc: float = 1.0) -> float:
+        """Measure the mean current over several readings
+
+        By default the readings are taken one at a time with measure_current. Source
+        meters that can take and buffer several readings per trigger should override this.
+
+        Args:
+            n (int): The number of readings to average
+            nplc (float): The integration time of each reading in power line cycles
+
+        Returns:
+            float: The mean of all values returned by the readings
+        """
+        total = 0.0
+        count = 0
+        for _ in range(n):
+            reading = self.measure_current()
+            total += reading.sum()
+            count += reading.size
+        return total / count
+
 
 class AbstractMultiplexer(AbstractDevice):
     """Provides an common interface for Multiplexers"""
@@ -117,6 +173,18 @@ class AbstractMultiplexer(AbstractDevice):
     @abstractmethod
     def disconnect_all(self) -> None: ...
 
+    def switch_to(self, connections: List[Tuple[str, str]]) -> None:
+        """Disconnect all channels, then make the given connections
+
+        Devices that can make several connections in one request should override this.
+
+        Args:
+            connections (List[Tuple[str, str]]): The channel pairs to connect
+        """
+        self.disconnect_all()
+        for channel1, channel2 in connections:
+            self.connect(channel1, channel2)
+
 
 # endregion [Abstract Classes]
 
@@ -136,6 +204,9 @@ class Multiplexer(AbstractMultiplexer):
         "2524/1-Wire Octal 16x1 Mux",
         "2524/1-Wire Sixteen 8x1 Mux",
     ]
+    # Open sessions by device name along with the (topology, simulate) they were
+    # opened with. Sessions stay open between contexts, see close_sessions.
+    _session_pool: Dict[str, Tuple[Tuple[str, bool], "niswitch.Session"]] = dict()
 
     def __init__(
         self, name: str, topology: Optional[str] = None, simulate: bool = False
@@ -168,20 +239,28 @@ class Multiplexer(AbstractMultiplexer):
             raise ValueError(f"Invalid Multiplexer Topology: {top}")
         self._topology = top
         self._reset_device = True
+        # the channel names depend on the topology
+        self._channel_cache: Optional[list] = None
 
     def get_channels(self) -> list:
         """Get the channels for the multiplexer device
 
+        Every channel name is a driver round-trip, so the list is cached until the
+        topology changes.
+
         Returns:
             list: A list of channels
         """
+        if self._channel_cache is not None:
+            return list(self._channel_cache)
         try:
             channel_count = self._session.channel_count
             channels = []
             for i in range(1, channel_count + 1):
                 channel_name = self._session.get_channel_name(i)
                 channels.append(str(channel_name))
-            return channels
+            self._channel_cache = channels
+            return list(channels)
         except Exception as e:
             self.logger.error("Error received from the multiplexer device")
             self.logger.exception(e)
@@ -244,14 +323,62 @@ class Multiplexer(AbstractMultiplexer):
             self.logger.exception(e)
             raise RequestError(f"Error connecting {channel1} and {channel2}")
 
+    def switch_to(self, connections: List[Tuple[str, str]]) -> None:
+        """Disconnect all channels, then make the given connections in a single request
+
+        Args:
+            connections (List[Tuple[str, str]]): The channel pairs to connect
+
+        Raises:
+            RequestError: If there is an error connecting the channels
+        """
+        self.disconnect_all()
+        connection_list = ", ".join(f"{channel1}->{channel2}" for channel1, channel2 in connections)
+        try:
+            self._session.connect_multiple(connection_list)
+        except Exception as e:
+            self.logger.error(f"Error connecting {connection_list}")
+            self.logger.exception(e)
+            raise RequestError(f"Error connecting {connection_list}")
+
     def get_device_info(self) -> dict:
         return {"name": self._name}
 
+    @classmethod
+    def close_sessions(cls) -> None:
+        """Close every pooled multiplexer session
+
+        Sessions are closed when the process exits. Call this earlier to let
+        another process open the device, e.g. before starting an experiment.
+        A session that fails to close is logged and dropped from the pool.
+        """
+        try:
+            for name, (_, session) in cls._session_pool.items():
+                try:
+                    session.close()
+                except Exception:
+                    logging.getLogger(__name__).exception(f"Failed to close the session of {name}")
+        finally:
+            cls._session_pool.clear()
+
     ## Context Handling Methods
     def __enter__(self):
-        """Open a session with the multiplexer device"""
+        """Open a session with the multiplexer device
 
+        Opening a session is slow, so a session that is already open for this
+        device with the same topology is reused.
+        """
+        settings = (self.topology, self.simulate)
+        pooled = self._session_pool.get(self._name)
+        if pooled is not None and pooled[0] == settings:
+            self._session = pooled[1]
+            self._reset_device = False
+            return self
         try:
+            if pooled is not None:
+                # the device only allows one session at a time
+                pooled[1].close()
+                del self._session_pool[self._name]
             if self.simulate:
                 self.logger.debug(f"Simulating with topology {self.topology}")
             else:
@@ -267,28 +394,34 @@ class Multiplexer(AbstractMultiplexer):
             self.logger.error(f"Error opening session with {self._name}")
             self.logger.exception(e)
             raise e
+        self._session_pool[self._name] = (settings, self._session)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        """Close the session with the multiplexer device"""
-        self.logger.debug(f"Closing multiplexer session")
-        self._session.close()
+        """Release the session with the multiplexer device
+
+        The session itself stays open in the pool, see close_sessions.
+        """
+        self.logger.debug(f"Releasing multiplexer session")
         self._session = None
         return False
 
 
+atexit.register(Multiplexer.close_sessions)
+
+
 class SourceMeter(AbstractSourceMeter):
     """Source Meter Device
         This class is a wrapper around the pyvisa library to interact with
         the source meters. By default, this class will connect to 'GPIB0::26::INSTR'
         which is the default address for the source meter. 
         """
-    class StateEnum(str, Enum):
-        init = "Initializing"
-        readVoltage = "Voltage Reading Mode"
-        readCurrent = "Current Reading Mode"
-        setVoltage = "Voltage Writing Mode"
-        setCurrentLimit = "Current Limit Setting Mode"
+    class StateEnum(IntEnum):
+        init = 0  # Initializing
+        readVoltage = 1  # Voltage Reading Mode
+        readCurrent = 2  # Current Reading Mode
+        setVoltage = 3  # Voltage Writing Mode
+        setCurrentLimit = 4  # Current Limit Setting Mode
 
     def __init__(
         self,
@@ -307,6 +440,27 @@ class SourceMeter(AbstractSourceMeter):
         self._current_levels = current_level
         self._voltage_range = voltage_range
         self._voltage_level = voltage_set
+        # setup sent once when the source meter switches into each mode
+        self._mode_setup: Dict[SourceMeter.StateEnum, str] = {
+            SourceMeter.StateEnum.readCurrent: ";".join(
+                (
+                    ':sens:func "CURR"',
+                    f":sens:curr:prot {current_level}",
+                    f":sens:curr:rang {current_level}",
+                    ":outp on",
+                )
+            ),
+            SourceMeter.StateEnum.readVoltage: ":sens:func volt",
+            SourceMeter.StateEnum.setVoltage: ";".join(
+                (
+                    ":sour:func volt",
+                    ":sour:volt:mode fix",
+                    f":sour:volt:range {voltage_range}",
+                    ":outp on",
+                )
+            ),
+            SourceMeter.StateEnum.setCurrentLimit: ':sens:func "CURR"',
+        }
 
     def measure_current(self) -> np.ndarray:
         """Measure the current from the source meter
@@ -317,18 +471,35 @@ class SourceMeter(AbstractSourceMeter):
         Returns:
             np.ndarray: An array of current values
         """
-        if self._prev_state != SourceMeter.StateEnum.readCurrent:
-            # set to read current mode then read the current
-            self._resource.write(':sens:func "CURR"')
-            self._resource.write(f":sens:curr:prot {self._current_levels}")
-            self._resource.write(f":sens:curr:rang {self._current_levels}")
-            self._resource.write(":outp on")
-            self._prev_state = SourceMeter.StateEnum.readCurrent
+        # set to read current mode then read the current
+        self._write_in_mode(SourceMeter.StateEnum.readCurrent)
         # reads a single point
-        data = self._resource.query_binary_values(
-            ":meas:curr?", datatype="f", container=np.ndarray, is_big_endian=True
+        return self._query_floats(":meas:curr?")
+
+    def measure_current_avg(self, n: int, nplc: float = 1.0) -> float:
+        """Measure the mean current over n readings taken with a single trigger
+
+        The source meter takes all of the readings and returns them in one response,
+        so the readings cost a single round trip instead of one per reading.
+
+        Args:
+            n (int): The number of readings to average
+            nplc (float): The integration time of each reading in power line cycles
+
+        Returns:
+            float: The mean of all values returned by the readings
+        """
+        self._write_in_mode(
+            SourceMeter.StateEnum.readCurrent,
+            f":sens:curr:nplc {nplc}",
+            f":trig:coun {n}",
         )
-        return data
+        try:
+            data = self._query_floats(":read?")
+        finally:
+            # measure_current expects a single reading per trigger
+            self._resource.write(":trig:coun 1")
+        return float(data.mean())
 
     def measure_voltage(self):
         """ Measure the voltage from the source meter
@@ -340,22 +511,15 @@ class SourceMeter(AbstractSourceMeter):
         Returns:
             np.ndarray: An array of voltage values
         """
-        if self._prev_state != SourceMeter.StateEnum.readVoltage:
-            self._resource.write(":sens:func volt")
-        data = self._resource.query_binary_values(
-            ":read:arr:volt?", datatype="f", container=np.ndarray, is_big_endian=True
-        )
-        return data
+        self._write_in_mode(SourceMeter.StateEnum.readVoltage)
+        return self._query_floats(":read:arr:volt?")
 
     def set_voltage(self, voltage: float):
-        if self._prev_state != SourceMeter.StateEnum.setVoltage:
-            self._resource.write(":sour:func volt")
-            self._resource.write(":sour:volt:mode fix")
-            self._resource.write(f":sour:volt:range {self._voltage_range}")
-            self._resource.write(":outp on")
         if voltage == None:
             voltage = self._voltage_level
-        self._resource.write(f":sour:volt:lev {voltage}")
+        self._write_in_mode(
+            SourceMeter.StateEnum.setVoltage, f":sour:volt:lev {voltage}"
+        )
 
     def set_current_limit(self, limit: float):
         """Set the current limit of the source meter
@@ -366,16 +530,66 @@ class SourceMeter(AbstractSourceMeter):
             limit (float): The current limit in milliamps
 
         """
-        if self._prev_state != SourceMeter.StateEnum.setCurrentLimit:
-            self._resource.write(':sens:func "CURR"')
         limit = int(limit)
-        self._resource.write(f":sens:curr:prot {limit}e-3")
+        self._write_in_mode(
+            SourceMeter.StateEnum.setCurrentLimit, f":sens:curr:prot {limit}e-3"
+        )
         # # Current range is set to the nearest power of 10
         # if limit < 10:
         #     self._resource.write(f":sens:curr:rang 10e-3")
         # elif limit < 100:
         #     self._resource.write(f":sens:curr:rang 100e-3")
 
+    def _write_batch(self, *commands: str) -> None:
+        """Write several SCPI commands to the source meter as a single message
+
+        Every GPIB write pays its own handshake overhead, so commands that are
+        always sent together are chained with ';' into one write. Each command
+        starts from the root (leading ':' or '*'), so chaining does not change
+        how the source meter interprets it.
+
+        Args:
+            commands (str): The SCPI commands to send, in order
+        """
+        self._resource.write(";".join(commands))
+
+    def _query_floats(self, query: str) -> np.ndarray:
+        """Query the source meter for a block of big-endian 32-bit floats
+
+        With an ndarray container PyVISA decodes the block with np.frombuffer and
+        a '>f4' dtype. The result is a read-only view of the received bytes, so
+        no byte swap or copy into a second array is needed.
+
+        Args:
+            query (str): The SCPI query to send
+
+        Returns:
+            np.ndarray: The values returned by the source meter
+        """
+        return self._resource.query_binary_values(
+            query, datatype="f", container=np.ndarray, is_big_endian=True
+        )
+
+    def _write_in_mode(self, state: "SourceMeter.StateEnum", *commands: str) -> None:
+        """Write commands, switching the source meter into ``state`` first if needed
+
+        The setup for a mode is only sent when the previous call left the source
+        meter in a different mode. Repeated calls in the same mode only write
+        ``commands``.
+
+        Args:
+            state (SourceMeter.StateEnum): The mode the commands require
+            commands (str): The SCPI commands to send once in that mode
+        """
+        if state is self._prev_state:
+            if commands:
+                self._write_batch(*commands)
+            return
+        # the mode is only cached once the setup has been sent
+        self._prev_state = None
+        self._write_batch(self._mode_setup[state], *commands)
+        self._prev_state = state
+
     def configure_output(self):
         """Configure the output of the source meter
 
@@ -395,13 +609,24 @@ class SourceMeter(AbstractSourceMeter):
         return {"name": self._name, "device": self._resource.query("*IDN?")}
 
     def __enter__(self):
-        rm = pyvisa.ResourceManager()
+        rm = _get_resource_manager()
         self.logger.debug(f"Opening {self._name}")
         try:
-            self._resource = rm.open_resource(self._name)
+            # A large chunk size lets a binary block come back in one VISA read.
+            # No read termination is set, the readings are raw float blocks of
+            # unknown length and any of their bytes can be a '\n'.
+            self._resource = rm.open_resource(
+                self._name,
+                chunk_size=1024 * 1024,
+                timeout=3000,
+                write_termination="\n",
+                send_end=True,
+            )
             # clear out device
-            self._resource.write("*rst; status:preset; *cls")
-            self._resource.write(":outp off")
+            self._write_batch("*rst", ":status:preset", "*cls", ":outp off")
+            self._prev_state = SourceMeter.StateEnum.init
+            # the reset above restores ASCII output, switch back to binary reads
+            self.configure_output()
         except Exception as e:
             self.logger.exception(e)
             self.logger.error(f"Failed to open {self._name}")
@@ -409,15 +634,25 @@ class SourceMeter(AbstractSourceMeter):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # only the session is closed, the resource manager is shared
+        if self._resource is not None:
+            self._resource.close()
         self._resource = None
-        return super().__exit__(exc_type, exc_value, traceback)
+        return False
 
 
 # endregion [Devices]
 # region Mock Devices
 
+# noise source for the mock readings
+_RNG = np.random.default_rng()
+
 
 class MockMultiplexer(Multiplexer):
+    # voltage grid the mock channel responses are tabulated on
+    lut_min_voltage = -20.0
+    lut_max_voltage = 20.0
+    lut_size = 4096
 
     def __init__(self, name="PXI1Slot2", *args, **kwargs):
         super().__init__(name)
@@ -448,6 +683,30 @@ class MockMultiplexer(Multiplexer):
 
         self._data = {"CH1": y1, "CH2": y2, "CH3": y3, "CH4": y4, "CH5": y5, "CH6": y6}
         self._connections: bidict[str, str] = bidict()
+        # every channel that is part of a connection, on either side
+        self._connected: set[str] = set()
+
+        # Tabulate the responses once so a reading is a single index lookup.
+        # tan/arctanh are undefined on parts of the grid, those entries are nan
+        # just like evaluating the function there would be.
+        voltages = np.linspace(self.lut_min_voltage, self.lut_max_voltage, self.lut_size)
+        with np.errstate(all="ignore"):
+            self._lut = {channel: func(voltages) for channel, func in self._data.items()}
+        self._lut_scale = (self.lut_size - 1) / (self.lut_max_voltage - self.lut_min_voltage)
+
+    def lut_index(self, voltage: float) -> int:
+        """Get the index of the grid point closest to a voltage
+
+        Voltages outside of the tabulated range are clamped to its ends.
+
+        Args:
+            voltage (float): The voltage to look up
+
+        Returns:
+            int: The index into the tabulated channel responses
+        """
+        idx = round((voltage - self.lut_min_voltage) * self._lut_scale)
+        return min(max(idx, 0), self.lut_size - 1)
 
     def get_channels(self) -> list:
         """Get the channels for the multiplexer device
@@ -487,14 +746,10 @@ class MockMultiplexer(Multiplexer):
             raise RequestError("No active context")
 
         if channel1 in self._channels and channel2 in self._channels:
-            if (
-                channel1 in self._connections
-                or channel1 in self._connections.inverse
-                or channel2 in self._connections
-                or channel2 in self._connections.inverse
-            ):
+            if channel1 in self._connected or channel2 in self._connected:
                 raise RequestError(f"Channel already connected")
             self._connections[channel2] = channel1
+            self._connected.update((channel1, channel2))
         else:
             raise RequestError(f"Invalid channels {channel1} and {channel2}")
 
@@ -502,8 +757,10 @@ class MockMultiplexer(Multiplexer):
         if self._context_counter == 0:
             raise RequestError("No active context")
         if channel1 in self._connections:
+            self._connected.difference_update((channel1, self._connections[channel1]))
             del self._connections[channel1]
         if channel2 in self._connections:
+            self._connected.difference_update((channel2, self._connections[channel2]))
             del self._connections[channel2]
         else:
             raise RequestError(f"Channel {channel1} not connected")
@@ -517,6 +774,11 @@ class MockMultiplexer(Multiplexer):
         if self._context_counter == 0:
             raise RequestError("No active context")
         self._connections.clear()
+        self._connected.clear()
+
+    def switch_to(self, connections: List[Tuple[str, str]]) -> None:
+        """Connect the pairs one by one, the mock has no session for Multiplexer.switch_to"""
+        AbstractMultiplexer.switch_to(self, connections)
 
     ## Context Handling Methods
     def __enter__(self):
@@ -551,6 +813,14 @@ class MockSourceMeter(AbstractSourceMeter):
         self.vgs_channel = config.vgs_channel
         self._voltage = 0
         self.mux = MockMultiplexer.get_instance(config.mux_address)
+        # The drain meter responds to the gate meter's voltage, resolve it once
+        # here instead of looking it up through the config on every reading
+        if self._name != config.vds_address:
+            self._gate_meter = None
+        elif config.vgs_address == config.vds_address:
+            self._gate_meter = self
+        else:
+            self._gate_meter = MockSourceMeter.get_instance(config.vgs_address)
 
     def measure_current(self) -> np.ndarray:
         """Measure the current from the source meter
@@ -563,21 +833,39 @@ class MockSourceMeter(AbstractSourceMeter):
         """
         if self._context_counter == 0:
             raise RequestError("No active context")
-        if self._prev_state != SourceMeter.StateEnum.readCurrent:
+        if self._prev_state is not SourceMeter.StateEnum.readCurrent:
             # set to read current mode then read the current
             self._prev_state = SourceMeter.StateEnum.readCurrent
         sleep(0.077)  # last measured at 77.4ms/read
+        return self._read_current()
 
+    def measure_current_avg(self, n: int, nplc: float = 1.0) -> float:
+        if self._context_counter == 0:
+            raise RequestError("No active context")
+        self._prev_state = SourceMeter.StateEnum.readCurrent
+        # one round trip plus the integration time of every reading at 60 Hz
+        sleep(0.077 + n * nplc / 60)
+        total = 0.0
+        count = 0
+        for _ in range(n):
+            reading = self._read_current()
+            total += reading.sum()
+            count += reading.size
+        return total / count
+
+    def _read_current(self) -> np.ndarray:
+        """Simulate a reading from the response of the connected channel"""
         connection = self.mux._connections.get(self.vgs_channel, "Nope")
-        func = self.mux._data.get(connection, np.ones(100) * -9.69)
+        lut = self.mux._lut.get(connection)
+        if lut is None:
+            # nothing with a known response is connected to the gate channel
+            return np.full(1, -9.69)
         try:
-            if self._name == Config.get_instance().vds_address:
-                v = MockSourceMeter.get_instance(
-                    Config.get_instance().vgs_address
-                )._voltage
-                data = func(v) + np.random.randn() * 0.5
+            if self._gate_meter is not None:
+                idx = self.mux.lut_index(self._gate_meter._voltage)
+                data = lut[idx] + _RNG.standard_normal() * 0.5
             else:
-                data = func(self._voltage)
+                data = lut[self.mux.lut_index(self._voltage)]
         except Exception as e:
             self.logger.error(f"Error reading current from {self.vgs_channel}")
             self.logger.exception(e)
@@ -590,7 +878,7 @@ class MockSourceMeter(AbstractSourceMeter):
     def set_voltage(self, alt_voltage: float = None):
         if self._context_counter == 0:
             raise RequestError("No active context")
-        if self._prev_state != SourceMeter.StateEnum.readVoltage:
+        if self._prev_state is not SourceMeter.StateEnum.readVoltage:
             self._prev_state = SourceMeter.StateEnum.setVoltage
         self._voltage = alt_voltage
         sleep(0.05)
@@ -598,7 +886,7 @@ class MockSourceMeter(AbstractSourceMeter):
     def set_current_limit(self, limit: float):
         if self._context_counter == 0:
             raise RequestError("No active context")
-        if self._prev_state != SourceMeter.StateEnum.setCurrentLimit:
+        if self._prev_state is not SourceMeter.StateEnum.setCurrentLimit:
             self._prev_state = SourceMeter.StateEnum.setCurrentLimit
         sleep(0.05)
 
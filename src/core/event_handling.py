@@ -1,6 +1,10 @@
-from abc import ABCMeta, abstractmethod
+import logging
+import os
 from collections import defaultdict
+from itertools import groupby
+from operator import attrgetter
 from pathlib import Path
+from queue import Empty
 from multiprocessing import Queue
 from multiprocessing.synchronize import Event
 from threading import Thread
@@ -8,14 +12,44 @@ from PySide6.QtCore import QThread, Signal
 from typing import Callable, Coroutine, Dict, List, Optional
 
 from core.utils import CellDataRow, Config
-from core.experiment import SequentialState
+from core.experiment import SequentialState, unpack_rows
+
+
+def _buffer_size_from_env(default: int) -> int:
+    """Read the data file buffer size from EGFET_CSV_BUF
+
+    Args:
+        default (int): The size to use when the variable is not set or invalid
+
+    Returns:
+        int: The buffer size in bytes
+    """
+    value = os.environ.get("EGFET_CSV_BUF")
+    if value is None:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size > 0:
+        return size
+    logging.getLogger(__name__).warning(
+        f"Ignoring EGFET_CSV_BUF={value!r}, it is not a positive integer"
+    )
+    return default
+
 
 # Constants
-DEFAULT_BUFFER_SIZE = 8000  # 8Kb
+# bytes buffered per data file before it is written, can be set with EGFET_CSV_BUF
+DEFAULT_BUFFER_SIZE = _buffer_size_from_env(256 * 1024)  # 256Kb
+DEFAULT_BATCH_SIZE = 64  # rows handed to the callbacks at once
+POLL_INTERVAL = 0.5  # seconds between checks of the shutdown event while the queue is empty
+# seconds the producer may stay quiet after shutdown before the data thread stops waiting
+SHUTDOWN_GRACE_PERIOD = 5.0
 
 
-class AbstractDataCallBack(metaclass=ABCMeta):
-    """Abstract base class for data callbacks.
+class AbstractDataCallBack:
+    """Base class for data callbacks.
 
     Data callbacks are used to process data from the experiment. The data
     is passed to the callback as a CellDataRow object. The callback can
@@ -24,13 +58,42 @@ class AbstractDataCallBack(metaclass=ABCMeta):
     The finalize method is called when the experiment is complete. This
     allows the callback to perform any cleanup or final processing of the
     data.
+
+    Callbacks run once per sample, so this is a plain class rather than an
+    ABC, and it defines empty __slots__ so subclasses can declare their own.
+    Nothing enforces the interface, subclasses must implement __call__ and
+    finalize.
     """
 
-    @abstractmethod
-    def __call__(self, data: CellDataRow | None) -> None: ...
+    __slots__ = ()
+
+    def __call__(self, data: CellDataRow | None) -> None:
+        raise NotImplementedError
+
+    def finalize(self) -> None:
+        raise NotImplementedError
+
+    def call_batch(self, data: List[CellDataRow]) -> None:
+        """Process consecutive rows that share the same state.
+
+        By default the callback is called once per row. Callbacks that can spread
+        work such as file writes over several rows should override this.
+
+        Args:
+            data: The rows to process, in the order they were received
+        """
+        for row in data:
+            self(row)
+
 
-    @abstractmethod
-    def finalize(self) -> None: ...
+def _call_per_row(callback: Callable) -> Callable:
+    """Adapt a callback that takes a single row to take a batch of rows"""
+
+    def call_batch(data: List[CellDataRow]) -> None:
+        for row in data:
+            callback(row)
+
+    return call_batch
 
 
 class ErrorHandlingThread(QThread):
@@ -60,10 +123,17 @@ class ErrorHandlingThread(QThread):
 class DataCallBackThread(Thread):
     """Contains the event loop for handling data from the experiment.
 
+    The producer puts batches of rows on the queue as CELL_DATA_DTYPE arrays and
+    None once it is done, which stops the thread after everything queued before
+    it has been handled. If the producer dies without sending None, the thread
+    stops once shutdown is set and the queue has stayed empty for
+    SHUTDOWN_GRACE_PERIOD seconds.
+
     Args:
         queue: The queue to read data from
-        shutdown: The event to signal the thread to shutdown
+        shutdown: The event to signal the experiment to shutdown
         callbacks: The callbacks to run when data is received
+        batch_size: The number of rows after which no more messages are taken at once
     """
 
     def __init__(
@@ -71,14 +141,19 @@ class DataCallBackThread(Thread):
         queue: Queue,
         shutdown: Event,
         callbacks: Dict[SequentialState, List[AbstractDataCallBack]],
+        batch_size: int = DEFAULT_BATCH_SIZE,
     ) -> None:
         super().__init__()
         self.queue = queue
         self.shutdown = shutdown
         self.callbacks = callbacks
+        self.batch_size = batch_size
 
     def update_callbacks(self, callbacks: Dict[str, Callable]) -> None:
         """Update the callbacks to run when data is received
+
+        The callbacks are resolved when the thread starts, so this has to be
+        called before start().
         
         Args:
             callbacks: A dictionary of callbacks to run for each state
@@ -89,33 +164,74 @@ class DataCallBackThread(Thread):
     def run(self) -> None:
         """The event loop for handling data from the experiment.
 
-        The thread will run until the shutdown event is set. It will then
-        process any remaining data in the queue and call the finalize method
-        on each callback.
+        The thread blocks on the queue until it receives the None sentinel.
+        Since the sentinel is the producer's last message, all of the data has
+        been processed by then and the finalize method is called on each callback.
+        The finalize methods are also called when the thread stops waiting after
+        shutdown.
 
         The callbacks are split into groups based on the state of the data
         received. For reference, the states are defined in the Status enum.
+        The groups are resolved into tuples once, before the first message.
+
+        When the experiment produces data faster than it is handled, everything
+        already queued is taken at once, until at least batch_size rows have been
+        collected. Consecutive rows
+        with the same state are passed together to each callback's call_batch,
+        so the order of the data is preserved.
         """
-        while not self.shutdown.is_set():
-            try:
-                # get the data from the queue
-                data = self.queue.get(timeout=1)
-            except:
-                continue
+        get_nowait = self.queue.get_nowait
+        batch_size = self.batch_size
+        dispatch = {
+            state: tuple(
+                getattr(callback, "call_batch", None) or _call_per_row(callback)
+                for callback in self.callbacks.get(state, ())
+            )
+            for state in SequentialState
+        }
+        # get the data from the queue until the producer signals it is done
+        done = False
+        while not done:
+            # wait for the next batch, then take whatever else is already queued
+            rows = []
+            data = self._next_message()
+            while data is not None:
+                rows.extend(unpack_rows(data))
+                if len(rows) >= batch_size:
+                    break
+                try:
+                    data = get_nowait()
+                except Empty:
+                    break
+            done = data is None
             # handle the data
-            callbacks = self.callbacks.get(data.state, [])
-            for callback in callbacks:
-                callback(data)
-
-        # process any remaining data
-        while not self.queue.empty():
-            data = self.queue.get()
-            callbacks = self.callbacks.get(data.state, [])
-            for callback in callbacks:
-                callback(data)
+            for state, group in groupby(rows, key=attrgetter("state")):
+                group = list(group)
+                for call_batch in dispatch[state]:
+                    call_batch(group)
 
         for state in SequentialState:
-            callbacks = self.callbacks.get(state, [])
-            for callback in callbacks:
+            for callback in self.callbacks.get(state, ()):
                 if hasattr(callback, "finalize"):
                     callback.finalize()
+
+    def _next_message(self):
+        """Wait for the next message on the queue
+
+        Returns:
+            The message, or None if shutdown is set and nothing arrived within
+            the grace period
+        """
+        get = self.queue.get
+        while not self.shutdown.is_set():
+            try:
+                return get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+        try:
+            return get(timeout=SHUTDOWN_GRACE_PERIOD)
+        except Empty:
+            logging.getLogger(__name__).warning(
+                "The experiment stopped without ending the data stream"
+            )
+            return None
@@ -1,12 +1,13 @@
 import numpy as np
 import logging
+import traceback
 from abc import ABCMeta, abstractmethod
 from enum import Enum
 from statemachine import StateMachine, State
 from statemachine.states import States
 from threading import Thread
-from typing import List, Dict, Optional, Type
-from time import time, sleep
+from typing import ClassVar, Iterator, List, Dict, Optional, Tuple, Type
+from time import monotonic, monotonic_ns, sleep
 from contextlib import ExitStack
 from multiprocessing import Process, Queue, Event
 from multiprocessing.synchronize import Event as EventType
@@ -18,6 +19,8 @@ import sounddevice as sd
 from core.devices import AbstractMultiplexer, AbstractSourceMeter
 from core.utils import Config, CellDataRow
 
+CRAB_RAVE_PATH = Path(__file__).resolve().parent.parent / "assets" / "crab_rave.mp3"
+
 
 class AbstractConnectionStrategy:
     """Provides an interface for connection strategies.
@@ -31,14 +34,43 @@ class AbstractConnectionStrategy:
     The purpose in using a connection strategy is to allow for different connection configurations
     to be used with the same experiment. This allows for greater flexibility in the experiment
     setup.
+
+    Strategies are used for every cell and sample, so they declare __slots__.
     """
 
+    __slots__ = ()
+
     @abstractmethod
     def connect_cell(self, cell_name: str) -> None: ...
 
     @abstractmethod
     def disconnect_cell(self, cell_name: str) -> None: ...
 
+    @abstractmethod
+    def switch_cell(self, cell_name: str) -> None:
+        """Disconnect everything, then connect only the given cell"""
+        ...
+
+    @staticmethod
+    def cell_channels(config: Config) -> Dict[str, Tuple[str, str]]:
+        """Look up the cell and reference channels of every mapped cell
+
+        The configuration does not change while an experiment runs, so strategies
+        resolve the channels once instead of on every connect and disconnect.
+
+        Args:
+            config (Config): The configuration object
+
+        Returns:
+            Dict[str, Tuple[str, str]]: The (cell channel, reference channel) of each cell
+        """
+        cell_mapping = config.cell_channel_mapping
+        reference_mapping = config.reference_channel_mapping
+        return {
+            name: (cell_mapping[name], reference_mapping[name])
+            for name in cell_mapping.keys() & reference_mapping.keys()
+        }
+
 
 class AbstractSamplingStrategy:
     """Provides an interface for sampling strategies.
@@ -47,8 +79,12 @@ class AbstractSamplingStrategy:
     is used to define how the data is sampled. This allows for different sampling strategies
     to be used with the same experiment. This allows for greater flexibility in the experiment
     setup.
+
+    Strategies are used for every cell and sample, so they declare __slots__.
     """
 
+    __slots__ = ()
+
     @abstractmethod
     def sample(self) -> np.ndarray: ...
 
@@ -59,8 +95,17 @@ class AbstractExperiment(StateMachine):
     This class is the base class for all experiment state machines. It defines the basic
     structure of an experiment state machine.
 
+    Rows are written into a preallocated CELL_DATA_DTYPE array and sent to the data
+    queue in batches, which cost a single copy to pickle. Rows recorded while sweeping
+    are collected with queue_data and sent once data_batch_size rows are waiting or
+    data_batch_interval seconds have passed since the last put, so the live views
+    stay responsive. Every other row is sent right away with put_data.
+
     """
 
+    data_batch_size = 32
+    data_batch_interval = 0.25  # seconds
+
     def __init__(
         self,
         vds_meter: AbstractSourceMeter,
@@ -84,11 +129,64 @@ class AbstractExperiment(StateMachine):
         self.sampling_strategy = sampling_strategy
         self.config = Config.get_instance()
         self.logger = logging.getLogger(__name__)
+        self._rows = np.empty(self.data_batch_size, dtype=CELL_DATA_DTYPE)
+        self._num_rows = 0
+        self._last_put = monotonic()
+        # entering the initial state already puts data, so this comes last
         super().__init__()
 
     def run(self) -> None:
         raise NotImplementedError
 
+    def queue_data(
+        self,
+        t_ns: int,
+        state: "SequentialState",
+        vgs_index: int,
+        cell_index: int,
+        sweep_index: int,
+        drain_voltage: float,
+        gate_voltage: float,
+        drain_current: float,
+    ) -> None:
+        """Queue a row, sending the pending rows once the batch is full or old enough
+
+        The arguments are the fields of CellDataRow, in the same order, except that
+        the time is given in integer nanoseconds.
+        """
+        self._rows[self._num_rows] = (
+            t_ns,
+            STATE_CODES[state],
+            vgs_index,
+            cell_index,
+            sweep_index,
+            drain_voltage,
+            gate_voltage,
+            drain_current,
+        )
+        self._num_rows += 1
+        if (
+            self._num_rows >= self.data_batch_size
+            or monotonic() - self._last_put >= self.data_batch_interval
+        ):
+            self.flush_data()
+
+    def put_data(self, *row) -> None:
+        """Send a row together with any pending rows right away
+
+        Args:
+            *row: The fields of the row, as for queue_data
+        """
+        self.queue_data(*row)
+        self.flush_data()
+
+    def flush_data(self) -> None:
+        """Send the pending rows to the data queue"""
+        if self._num_rows:
+            self.data_queue.put(self._rows[: self._num_rows].copy())
+            self._num_rows = 0
+        self._last_put = monotonic()
+
     @staticmethod
     def verify_config(config: Config) -> bool:
         """Verify the configuration
@@ -104,97 +202,139 @@ class AbstractExperiment(StateMachine):
 class MultiExternalReferenceStrategy(AbstractConnectionStrategy):
     """Use this strategy when there is an external reference electrode shared between all cells."""
 
+    __slots__ = ("mux", "vgs_channel", "reference_common", "reference_channels", "_cell_pairs")
+
     def __init__(self, mux: AbstractMultiplexer):
         self.mux = mux
         self.vgs_channel = "com0"
         self.reference_common = "com8"
         self.reference_channels = [f"ch{idx}" for idx in range(64, 72)]
+        self._cell_pairs = self.cell_channels(Config.get_instance())
 
     def connect_cell(self, cell_name: str) -> None:
-        config = Config.get_instance()
-        cell_channel = config.cell_channel_mapping[cell_name]
-        reference_channel = config.reference_channel_mapping[cell_name]
+        cell_channel, reference_channel = self._cell_pairs[cell_name]
         assert reference_channel in self.reference_channels # just check that you're not being dumb
         self.mux.connect(cell_channel, self.vgs_channel)
         self.mux.connect(self.reference_common, reference_channel)
 
     def disconnect_cell(self, cell_name: str) -> None:
-        config = Config.get_instance()
-        cell_channel = config.cell_channel_mapping[cell_name]
-        reference_channel = config.reference_channel_mapping[cell_name]
+        cell_channel, reference_channel = self._cell_pairs[cell_name]
         self.mux.disconnect(cell_channel, self.vgs_channel)
         self.mux.disconnect(self.reference_common, reference_channel)
 
+    def switch_cell(self, cell_name: str) -> None:
+        cell_channel, reference_channel = self._cell_pairs[cell_name]
+        assert reference_channel in self.reference_channels
+        self.mux.switch_to(
+            [(cell_channel, self.vgs_channel), (self.reference_common, reference_channel)]
+        )
+
 
 class OnChipStrategy(AbstractConnectionStrategy):
     """Use this strategy when each cell has in internal reference electrode."""
 
+    __slots__ = ("mux", "vgs_channel", "reference_common", "_cell_pairs")
+
     def __init__(self, mux: AbstractMultiplexer):
         self.mux = mux
         self.vgs_channel = "com0"
         self.reference_common = "com4"
+        self._cell_pairs = self.cell_channels(Config.get_instance())
 
     def connect_cell(self, cell_name: str) -> None:
-        config = Config.get_instance()
-        cell_channel = config.cell_channel_mapping[cell_name]
-        ref_channel = config.reference_channel_mapping[cell_name]
+        cell_channel, ref_channel = self._cell_pairs[cell_name]
         self.mux.connect(self.vgs_channel, cell_channel)
         self.mux.connect(self.reference_common, ref_channel)
 
     def disconnect_cell(self, cell_name: str) -> None:
-        config = Config.get_instance()
-        cell_channel = config.cell_channel_mapping[cell_name]
-        ref_channel = config.reference_channel_mapping[cell_name]
+        cell_channel, ref_channel = self._cell_pairs[cell_name]
         self.mux.disconnect(self.vgs_channel, cell_channel)
         self.mux.disconnect(self.reference_common, ref_channel)
 
+    def switch_cell(self, cell_name: str) -> None:
+        cell_channel, ref_channel = self._cell_pairs[cell_name]
+        self.mux.switch_to(
+            [(self.vgs_channel, cell_channel), (self.reference_common, ref_channel)]
+        )
+
 
 class AveragingSamplingStrategy(AbstractSamplingStrategy):
-    def __init__(self, vds_meter:AbstractSourceMeter):
+    __slots__ = ("vds_meter", "num_samples")
+
+    def __init__(self, vds_meter:AbstractSourceMeter, num_samples: int = 20):
         self.vds_meter = vds_meter
+        self.num_samples = num_samples
 
     def sample(self):
-        sleep(0.5)
-        data = []
-        for _ in range(20):
-            data.append(self.vds_meter.measure_current())
-        return np.mean(data)
+        # the source meter averages the readings taken with a single trigger
+        return self.vds_meter.measure_current_avg(self.num_samples)
 
 
 class SimpleSamplingStrategy(AbstractSamplingStrategy):
     """Sample the current from the source meter as point measurements."""
 
+    __slots__ = ("vds_meter",)
+
     def __init__(self, vds_meter: AbstractSourceMeter):
         self.vds_meter = vds_meter
 
     def sample(self) -> np.ndarray:
         sleep(0.1)
-        return np.mean(self.vds_meter.measure_current())
+        # the mean of a reading with only a few values, without np.mean's overhead
+        reading = self.vds_meter.measure_current()
+        return float(reading.sum()) / reading.size
 
 class StableSamplingStrategy(SimpleSamplingStrategy):
     """Sample the current from the source meter until the current is stable."""
 
+    __slots__ = ("threshold", "_window", "_buf", "_diff", "_last_rel_drift")
+
     def __init__(self, vds_meter: AbstractSourceMeter, threshold: float = 0.05):
         super().__init__(vds_meter)
         
         self.threshold = threshold
+        # sliding window of the latest samples, reused for every sample() call
+        self._window = 10
+        self._buf = np.empty(self._window, dtype=np.float64)
+        self._diff = np.empty(self._window - 1, dtype=np.float64)
+        # relative drift found by the last check_relative_threshold call
+        self._last_rel_drift = 0.0
 
     def check_relative_threshold(self, data) -> bool:
-        diff = np.diff(data)
         max_value = data.max()
         if max_value == 0:
+            self._last_rel_drift = 0.0
             return False
-        return diff.max() / max_value > self.threshold
+        # forward differences written into a preallocated buffer, same as np.diff
+        diff = np.subtract(data[1:], data[:-1], out=self._diff[: len(data) - 1])
+        self._last_rel_drift = diff.max() / max_value
+        return self._last_rel_drift > self.threshold
 
     def sample(self) -> np.ndarray:
-        data = np.empty(10)
-        for i in range(10):
+        data = self._buf
+        for i in range(self._window):
             data[i] = super().sample()
         while self.check_relative_threshold(data):
-            data = np.roll(data, -1)
+            # shift the window left in place and append the newest sample
+            data[:-1] = data[1:]
             data[-1] = super().sample()
-            sleep(1)
-        return np.mean(data)
+            # wait longer the further the signal is from settling, up to a second
+            sleep(max(0.05, min(1.0, 5 * abs(self._last_rel_drift))))
+        return float(data.sum()) / self._window
+
+
+# Connection strategy for each supported multiplexer topology
+_STRATEGY_BY_TOPOLOGY: Dict[str, Type[AbstractConnectionStrategy]] = {
+    "2524/1-Wire Dual 64x1 Mux": MultiExternalReferenceStrategy,
+    "2524/1-Wire Quad 32x1 Mux": OnChipStrategy,
+}
+
+# Sampling strategy for each sampling mode
+_SAMPLING_BY_MODE: Dict[str, Type[AbstractSamplingStrategy]] = {
+    "simple": SimpleSamplingStrategy,
+    "stable": StableSamplingStrategy,
+    "mean": AveragingSamplingStrategy,
+}
 
 
 class ExperimentSupervisor(Process):
@@ -238,6 +378,7 @@ class ExperimentSupervisor(Process):
 
         """
         Config.set_instance(self.config)
+        experiment = None
         try:
             # Using ExitStack to ensure that all resources are properly closed even if an exception occurs
             with ExitStack() as stack:
@@ -250,25 +391,17 @@ class ExperimentSupervisor(Process):
                 multiplexer = stack.enter_context(
                     self.multiplexer_class.get_instance(self.config.mux_address, topology=self.config.mux_topology)
                 )
-                match self.config.mux_topology:
-                    case "2524/1-Wire Dual 64x1 Mux":
-                        connection_strategy = MultiExternalReferenceStrategy(multiplexer)
-                    case "2524/1-Wire Quad 32x1 Mux":
-                        connection_strategy = OnChipStrategy(multiplexer)
-                    case _:
-                        raise ValueError(f"Invalid Mux Topology {self.config.mux_topology} or not defined for this experiment type")
+                connection_strategy_class = _STRATEGY_BY_TOPOLOGY.get(self.config.mux_topology)
+                if connection_strategy_class is None:
+                    raise ValueError(f"Invalid Mux Topology {self.config.mux_topology} or not defined for this experiment type")
+                connection_strategy = connection_strategy_class(multiplexer)
 
                 multiplexer.topology = self.config.mux_topology
 
-                match self.config.sampling_mode:
-                    case "simple":
-                        sampling_strategy = SimpleSamplingStrategy(vds_meter)
-                    case "stable":
-                        sampling_strategy = StableSamplingStrategy(vds_meter)
-                    case "mean":
-                        sampling_strategy = AveragingSamplingStrategy(vds_meter)
-                    case _:
-                        raise Exception("Invalid Sampling Mode")
+                sampling_strategy_class = _SAMPLING_BY_MODE.get(self.config.sampling_mode)
+                if sampling_strategy_class is None:
+                    raise Exception("Invalid Sampling Mode")
+                sampling_strategy = sampling_strategy_class(vds_meter)
                 # Initialize Experiment
                 experiment = self.experiment_class(
                     vds_meter,
@@ -290,15 +423,23 @@ class ExperimentSupervisor(Process):
                 #self.logger.info(f"Starting loop {experiment.loop_count + 1} of {self.config.num_loops}")
                 self.logger.info("Experiment Complete")
         except Exception as e:
-            import traceback as tb
-
             self.logger.error(f"An error occurred: {e}")
             self.logger.exception(e)
             # get stack trace
-            stack_trace = tb.format_exc()
+            stack_trace = traceback.format_exc()
             self.error_queue.put(stack_trace)
         finally:
-            self.shutdown.set()
+            try:
+                if experiment is not None:
+                    # rows of an interrupted sweep may still be waiting for a batch
+                    experiment.flush_data()
+            finally:
+                # tell the data consumers that nothing else is coming, even if the
+                # last rows could not be sent
+                self.data_queue.put(None)
+                self.shutdown.set()
+            # multiprocessing children may exit without running atexit handlers
+            self.multiplexer_class.close_sessions()
 
 
 class SequentialState(str, Enum):
@@ -318,13 +459,46 @@ class SequentialState(str, Enum):
     verify_sweep = "Verify Sweep"
     end = "End"
 
+
+# Rows travel through the data queue as arrays of this record type. The time is
+# stored in nanoseconds and the state as its position in SequentialState.
+CELL_DATA_DTYPE = np.dtype(
+    [
+        ("time_ns", np.int64),
+        ("state", np.uint8),
+        ("vgs_index", np.int32),
+        ("cell_index", np.int32),
+        ("sweep_index", np.int32),
+        ("drain_voltage", np.float64),
+        ("gate_voltage", np.float64),
+        ("drain_current", np.float64),
+    ]
+)
+STATE_CODES: Dict[SequentialState, int] = {
+    state: code for code, state in enumerate(SequentialState)
+}
+
+
+def unpack_rows(batch: np.ndarray) -> List[CellDataRow]:
+    """Turn a batch received from the data queue back into rows
+
+    The time of the rows is converted back to seconds.
+
+    Args:
+        batch (np.ndarray): The rows as a CELL_DATA_DTYPE array
+
+    Returns:
+        List[CellDataRow]: The rows in the order they were recorded
+    """
+    states = tuple(SequentialState)
+    return [
+        CellDataRow(t_ns * 1e-9, states[state], *fields)
+        for t_ns, state, *fields in batch.tolist()
+    ]
+
 def play_audio(buffer, sr, event):
-    chunk=16000
-    idx=60
     sd.play(buffer, blocking=False, samplerate=sr)
-    while not event.is_set():
-        sleep(1)
-
+    event.wait()
     sd.stop()
 
 
@@ -381,6 +555,9 @@ class SequentialEFGETExperiment(AbstractExperiment):
         | _states.verify_sweep.to(_states.wait_record)
     )
 
+    # (samples, sample rate) of the waiting music, decoded once per process
+    _crab_rave: ClassVar[Optional[Tuple[Optional[np.ndarray], int]]] = None
+
     def __init__(
         self,
         vds_meter: AbstractSourceMeter,
@@ -416,10 +593,45 @@ class SequentialEFGETExperiment(AbstractExperiment):
       #  self.stability_sweep_index = 0
         self.crab_rave = None
         self.crab_rave_shutdown = Event()
-        self.crab_rave_buffer, self.crsf = sf.read("C:\\Users\\lmacosta\\Documents\\Python\\EGFET\\egfet-experiment-controls\\src\\assets\\crab_rave.mp3")
-        
+
+        # The config does not change during an experiment, so the sweep and the
+        # number of cells are only looked up once
+        self._compute_sweep()
+        self._n_cells = len(self.config.cell_names)
+
+    @classmethod
+    def load_crab_rave(cls) -> Tuple[Optional[np.ndarray], int]:
+        """Decode the waiting music the first time it is needed
+
+        The samples are kept read-only on the class, so the file is decoded at most
+        once per process instead of every time an experiment is created.
+
+        Returns:
+            Tuple[Optional[np.ndarray], int]: The samples and the sample rate. The
+                samples are None if the file could not be read.
+        """
+        if cls._crab_rave is None:
+            try:
+                buffer, samplerate = sf.read(str(CRAB_RAVE_PATH))
+            except Exception:
+                logging.getLogger(__name__).exception(f"Could not read {CRAB_RAVE_PATH}")
+                buffer, samplerate = None, 0
+            else:
+                buffer.flags.writeable = False
+            cls._crab_rave = (buffer, samplerate)
+        return cls._crab_rave
 
     # Utility methods
+    def _compute_sweep(self) -> None:
+        """Compute the voltages of one sweep from the start voltage in voltage steps
+
+        The sweep includes the start voltage and every step up to the end voltage.
+        """
+        start = self.config.start_voltage
+        step = self.config.voltage_step
+        num_steps = int((self.config.end_voltage - start) / step)
+        self._vgs_sweep: List[float] = (start + np.arange(num_steps + 1) * step).tolist()
+        self._sweep_len = len(self._vgs_sweep)
 
    # def _reset_stability(self):
     #    self._stability_data = []
@@ -449,16 +661,13 @@ class SequentialEFGETExperiment(AbstractExperiment):
         #return False
 
     def is_experiment_complete(self):
-        complete = self.cell_index >= len(self.config.cell_names)
+        complete = self.cell_index >= self._n_cells
         if complete:
             self.cell_index = 0
         return complete
        
     def is_current_sweep_complete(self) -> bool:
-        complete = self.vgs_index > int(
-            (self.config.end_voltage - self.config.start_voltage)
-            / self.config.voltage_step
-        )
+        complete = self.vgs_index >= self._sweep_len
         if complete:
             self.vgs_index = 0
             self.sweep_index += 1
@@ -504,7 +713,7 @@ class SequentialEFGETExperiment(AbstractExperiment):
     # State Methods
     def on_enter_pause(self):
         self.logger.debug("Pausing")
-        data = CellDataRow(
+        self.put_data(
             0,
             SequentialState.pause,
             self.vgs_index,
@@ -515,9 +724,11 @@ class SequentialEFGETExperiment(AbstractExperiment):
             0,
            # loop_count=self.loop_count,
         )
-        self.data_queue.put(data)
         self.pause_resume_event.clear()
-        self.pause_resume_event.wait()
+        # wake up regularly so that stopping the experiment does not wait for a resume
+        while not self.pause_resume_event.wait(timeout=0.25):
+            if self.shutdown.is_set():
+                return
 
     def on_exit_resume(self):
         self.logger.debug("Resuming")
@@ -539,7 +750,7 @@ class SequentialEFGETExperiment(AbstractExperiment):
         # Set binary outputs
         self.vds_meter.configure_output()
         self.vgs_meter.configure_output()
-        data = CellDataRow(
+        self.put_data(
             0,
             SequentialState.idle,
             0,
@@ -550,7 +761,6 @@ class SequentialEFGETExperiment(AbstractExperiment):
             0,
            # 0,
         )
-        self.data_queue.put(data)
 
    # def on_enter_wait_start(self):
     #   self.logger.debug("Waiting for User Start")
@@ -605,7 +815,7 @@ class SequentialEFGETExperiment(AbstractExperiment):
 
     def on_enter_wait_record(self):
        self.logger.debug("Waiting for User Start")
-       data = CellDataRow(
+       self.put_data(
             0,
             SequentialState.wait_record,
             self.vgs_index,
@@ -616,10 +826,11 @@ class SequentialEFGETExperiment(AbstractExperiment):
             0,
             #loop_count=self.loop_count,
         )
-       self.data_queue.put(data)
        self.crab_rave_shutdown.clear()
-       self.crab_rave = Process(target=play_audio, args=(self.crab_rave_buffer, self.crsf, self.crab_rave_shutdown))
-       self.crab_rave.start()
+       crab_rave_buffer, crsf = self.load_crab_rave()
+       if crab_rave_buffer is not None:
+           self.crab_rave = Process(target=play_audio, args=(crab_rave_buffer, crsf, self.crab_rave_shutdown))
+           self.crab_rave.start()
        self.user_event_trigger.clear()
       # self.user_event_trigger.wait()
        self.crab_rave_shutdown.set()
@@ -629,44 +840,42 @@ class SequentialEFGETExperiment(AbstractExperiment):
         # get cell connection
        self.vgs_index = 0
        cell_name = self.config.cell_names[self.cell_index]
-       self.multiplexer.disconnect_all()
-       self.connection_strategy.connect_cell(cell_name)
-       self.start_time = time()
+       self.connection_strategy.switch_cell(cell_name)
+       self.start_time_ns = monotonic_ns()
 
     def on_exit_wait_record(self):
-        self.start_time = time()
+        self.start_time_ns = monotonic_ns()
 
     def on_enter_verify_sweep(self):
+        self.flush_data()
         self.vgs_index = 0
 
     def on_enter_cell_sweep(self):
         self.logger.debug("Cell Sweep Iteration")
-        gate_voltage = (
-            self.config.start_voltage + self.vgs_index * self.config.voltage_step
-        )
+        vgs_index = self.vgs_index
+        gate_voltage = self._vgs_sweep[vgs_index]
         self.vgs_meter.set_voltage(gate_voltage)
-        self.vgs_index += 1
-        t = time() - self.start_time
+        self.vgs_index = vgs_index = vgs_index + 1
+        t_ns = monotonic_ns() - self.start_time_ns
         # These first two are set by us, so we don't expect any changes
         # we allow for different sampling strategies for drain current since this
         # is mutable and we may want to aggregate measurements
         drain_current = self.sampling_strategy.sample()
-        data = CellDataRow(
-            t,
+        self.queue_data(
+            t_ns,
             SequentialState.cell_sweep,
-            self.vgs_index,
+            vgs_index,
             self.cell_index,
             self.sweep_index,
-            Config.get_instance().drain_voltage,
+            self.config.drain_voltage,
             gate_voltage,
             drain_current,
            # loop_count=self.loop_count,
         )
-        self.data_queue.put(data)
 
     def on_enter_end(self):
         self.logger.debug("Experiment Complete")
-        data = CellDataRow(
+        self.put_data(
             0,
             SequentialState.end,
             self.vgs_index,
@@ -677,7 +886,6 @@ class SequentialEFGETExperiment(AbstractExperiment):
             0,
           #  loop_count=self.loop_count,
         )
-        self.data_queue.put(data)
         self.multiplexer.disconnect_all()
         self.vds_meter.set_voltage(0)
         self.vgs_meter.set_voltage(0)
@@ -686,21 +894,49 @@ class SequentialEFGETExperiment(AbstractExperiment):
 
     @staticmethod
     def verify_config(config: Config) -> bool:
-        return (
-            True
-            and config.vds_address != "None Selected"
-            and config.vgs_address != "None Selected"
-            and config.vgs_channel != "None Selected"
-            and config.mux_address is not None
-            and config.mux_topology is not None
-            and config.start_voltage < config.end_voltage
-            and config.voltage_step > 0
-            and config.drain_current_limit > 0
-            and config.gate_current_limit > 0
-            and len(config.cell_names) > 0
-            and len(config.cell_channel_mapping) > 0
-            and len(config.reference_channel_mapping) >= 0
-        )
+        for error in SequentialEFGETExperiment._config_errors(config):
+            logging.getLogger(__name__).error(f"Invalid configuration: {error}")
+            return False
+        return True
+
+    @staticmethod
+    def _config_errors(config: Config) -> Iterator[str]:
+        """Check the configuration, stopping at the first problem the caller consumes
+
+        Args:
+            config (Config): The configuration object
+
+        Yields:
+            str: A description of each problem with the configuration
+        """
+        if config.vds_address == "None Selected":
+            yield "no Vds source meter selected"
+        if config.vgs_address == "None Selected":
+            yield "no Vgs source meter selected"
+        if config.vgs_channel == "None Selected":
+            yield "no Vgs channel selected"
+        if config.mux_address is None:
+            yield "no multiplexer selected"
+        if config.mux_topology is None:
+            yield "no multiplexer topology selected"
+        if config.start_voltage >= config.end_voltage:
+            yield "the start voltage must be below the end voltage"
+        if config.voltage_step <= 0:
+            yield "the voltage step must be positive"
+        if config.drain_current_limit <= 0:
+            yield "the drain current limit must be positive"
+        if config.gate_current_limit <= 0:
+            yield "the gate current limit must be positive"
+        if not config.cell_names:
+            yield "no cells defined"
+        if not config.cell_channel_mapping:
+            yield "no cell channels mapped"
+        missing = [
+            name for name in config.cell_names
+            if name not in config.reference_channel_mapping
+        ]
+        if missing:
+            yield f"no reference channel mapped for {', '.join(missing)}"
 
 class ReversedSequentialEGFETExperiment(SequentialEFGETExperiment):
     """ For reversed mode, we repurpose any drain configs for the gate voltage.
@@ -727,7 +963,7 @@ class ReversedSequentialEGFETExperiment(SequentialEFGETExperiment):
         # Set binary outputs
         self.vds_meter.configure_output()
         self.vgs_meter.configure_output()
-        data = CellDataRow(
+        self.put_data(
             0,
             SequentialState.idle,
             0,
@@ -738,7 +974,6 @@ class ReversedSequentialEGFETExperiment(SequentialEFGETExperiment):
             0,
            # loop_count=self.loop_count,
         )
-        self.data_queue.put(data)
 
     #def on_enter_stability_sweep(self):
      #   self.logger.debug("Running VGS Stability Sweep")
@@ -767,21 +1002,20 @@ class ReversedSequentialEGFETExperiment(SequentialEFGETExperiment):
     def on_enter_cell_sweep(self):
         self.logger.debug("Cell Sweep Iteration")
         # repurposing vgs index to iterate over drain voltages
-        gate_voltage = Config.get_instance().drain_voltage # drain voltage is used to store the constant gate voltage
-        drain_voltage = (
-            self.config.start_voltage + self.vgs_index * self.config.voltage_step
-        )
+        gate_voltage = self.config.drain_voltage # drain voltage is used to store the constant gate voltage
+        vgs_index = self.vgs_index
+        drain_voltage = self._vgs_sweep[vgs_index]
         self.vds_meter.set_voltage(drain_voltage)
-        self.vgs_index += 1
-        t = time() - self.start_time
+        self.vgs_index = vgs_index = vgs_index + 1
+        t_ns = monotonic_ns() - self.start_time_ns
         # These first two are set by us, so we don't expect any changes
         # we allow for different sampling strategies for drain current since this
         # is mutable and we may want to aggregate measurements
         drain_current = self.sampling_strategy.sample()
-        data = CellDataRow(
-            t,
+        self.queue_data(
+            t_ns,
             SequentialState.cell_sweep,
-            self.vgs_index,
+            vgs_index,
             self.cell_index,
             self.sweep_index,
             # in reversed mode drain voltage is repurposed for setting the gate voltage
@@ -790,7 +1024,6 @@ class ReversedSequentialEGFETExperiment(SequentialEFGETExperiment):
             drain_current,
            # loop_count=self.loop_count,
         )
-        self.data_queue.put(data)
 
 
 if __name__ == "__main__":
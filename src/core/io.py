@@ -1,63 +1,237 @@
-from collections import defaultdict
+import logging
+import os
+from itertools import groupby
+from operator import attrgetter
 from pathlib import Path
-from typing import Dict, Tuple
+from queue import SimpleQueue
+from threading import Thread
+from typing import Dict, List, Optional, Tuple
 
-from core.event_handling import AbstractDataCallBack
+from core.event_handling import AbstractDataCallBack, DEFAULT_BUFFER_SIZE
 from core.utils import Config, CellDataRow
 from core.experiment import SequentialState
 
+# Data files are written through raw file descriptors, O_BINARY keeps Windows from
+# translating the line endings a second time
+_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+# os.writev is not available on Windows
+_HAS_WRITEV = hasattr(os, "writev")
+# os.fdatasync skips the metadata that does not matter for reading the data back,
+# it is not available on Windows or macOS
+_sync = os.fdatasync if hasattr(os, "fdatasync") else os.fsync
+# every (cell, sweep) is written to its own file
+_file_key = attrgetter("cell_index", "sweep_index")
+
+
+def _row_values(data: CellDataRow) -> Tuple[float, float, float, float]:
+    """Get the values of a row in the order of the CSV columns
+
+    The values are converted to Python floats, %a would write a numpy scalar as
+    its repr, e.g. np.float64(1.5).
+    """
+    return (
+        float(data.time),
+        float(data.drain_voltage),
+        float(data.gate_voltage),
+        float(data.drain_current),
+    )
+
+
 class CSVDataCallBack(AbstractDataCallBack):
     """ Callback for writing data to CSV files.
+
+    Full buffers are handed to a writer thread, so the data callback thread does not
+    wait for the disk. The writer is started with the first file of an experiment
+    and stopped by finalize once everything has been written.
     """
-    def __init__(self, buffer_size: int = 8000) -> None:
-        self.files: Dict[Tuple[int], Path] = dict()
-        self.buffers: Dict[Tuple[int, int], str] = dict()
+    __slots__ = (
+        "files",
+        "buffers",
+        "config",
+        "buffer_size",
+        "stability_sweep_index",
+        "_write_q",
+        "_writer",
+        "_name_parts",
+    )
+
+    # The CellDataRow.HEADER columns and their fields, encoded once. %a formats
+    # the floats from _row_values like str(), so the output matches joining the
+    # values by hand, and the platform line ending matches what a text mode file
+    # would write.
+    _HEADER = (",".join(CellDataRow.HEADER) + os.linesep).encode()
+    _ROW_FMT = ("%a,%a,%a,%a" + os.linesep).encode()
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE) -> None:
+        # descriptor of each (cell, sweep) file that is still open
+        self.files: Dict[Tuple[int, int], int] = dict()
+        # bytes waiting to be written, per (cell, sweep) file started since finalize
+        self.buffers: Dict[Tuple[int, int], bytearray] = dict()
         self.config = Config.get_instance()
         self.buffer_size = buffer_size
         self.stability_sweep_index = 0 
+        # (fd, data) to write, (fd, None) to close the file and None to stop the writer
+        self._write_q: SimpleQueue = SimpleQueue()
+        self._writer: Optional[Thread] = None
+        # (root, filename template, cell names) for filename_from_data
+        self._name_parts: Optional[Tuple[Path, str, List[str]]] = None
 
     def __call__(self, data: CellDataRow | None) -> None:
         if data is None:
             return
 
-        if (data.cell_index, data.sweep_index) not in self.files:
-            # Make a new file and write the header
-            filename = self.filename_from_data(data)
-            self.files[(data.cell_index, data.sweep_index)] = filename
-            self.buffers[(data.cell_index, data.sweep_index)] = (
-                ",".join(data.header) + "\n"
-            )
+        key = (data.cell_index, data.sweep_index)
+        buffer = self._buffer_for(key, data)
         # Write the data to the buffer
-        buffer = ",".join(map(str, CellDataRow.data_as_list(data))) + "\n"
-        self.buffers[(data.cell_index, data.sweep_index)] += buffer
-        if len(self.buffers[(data.cell_index, data.sweep_index)]) > self.buffer_size:
+        buffer += self._ROW_FMT % _row_values(data)
+        if len(buffer) > self.buffer_size:
             # Write the buffer to the file if it is too large
-            with open(self.files[(data.cell_index, data.sweep_index)], "a") as f:
-                f.write(self.buffers[(data.cell_index, data.sweep_index)])
-            self.buffers[(data.cell_index, data.sweep_index)] = ""
+            self.write_buffer(key)
+
+    def call_batch(self, data: List[CellDataRow]) -> None:
+        """Write a batch of rows, formatting the rows of each file in one go."""
+        fmt = self._ROW_FMT
+        for key, rows in groupby(data, key=_file_key):
+            rows = list(rows)
+            buffer = self._buffer_for(key, rows[0])
+            buffer += b"".join([fmt % values for values in map(_row_values, rows)])
+            if len(buffer) > self.buffer_size:
+                # Write the buffer to the file if it is too large
+                self.write_buffer(key)
+
+    def _buffer_for(self, key: Tuple[int, int], data: CellDataRow) -> bytearray:
+        """Get the buffer of a file, opening the file if it is not open.
+
+        A file that was closed because another file was started is opened again
+        and appended to without repeating the header.
+        """
+        if key in self.files:
+            return self.buffers[key]
+        # Sweeps are recorded one after the other, so the earlier files are complete
+        self.close_files()
+        if self._writer is None:
+            self._writer = Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+        self.files[key] = os.open(self.filename_from_data(data), _OPEN_FLAGS, 0o644)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            # A new file starts with the header
+            buffer = self.buffers[key] = bytearray(self._HEADER)
+        return buffer
+
+    def write_buffer(self, key: Tuple[int, int]) -> None:
+        """Hand the buffered bytes of an open file to the writer and start a new buffer."""
+        buffer = self.buffers[key]
+        if buffer:
+            self._write_q.put((self.files[key], buffer))
+            self.buffers[key] = bytearray()
+
+    def close_files(self) -> None:
+        """Write any remaining data and close the open files.
+
+        Each file is synced to disk once, when it is closed, rather than after
+        every write.
+        """
+        for key, fd in self.files.items():
+            self.write_buffer(key)
+            self._write_q.put((fd, None))
+        self.files.clear()
 
     def finalize(self) -> None:
-        """Write any remaining data to the files."""
-        for (cell_index, sweep_index), buffer in self.buffers.items():
-            if buffer:
-                with open(self.files[(cell_index, sweep_index)], "a") as f:
-                    f.write(buffer)
+        """Write any remaining data to the files.
+
+        Returns once the writer has written, synced and closed every file.
+        """
+        self.close_files()
         self.buffers.clear()
+        self._name_parts = None
+        if self._writer is not None:
+            self._write_q.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _writer_loop(self) -> None:
+        """Write and close files in the order the requests were queued.
+
+        Everything that is already queued is taken at once, so several buffers for
+        the same file are written with a single writev call where it is available.
+        """
+        get = self._write_q.get
+        empty = self._write_q.empty
+        running = True
+        while running:
+            pending: Dict[int, List[bytearray]] = {}
+            requests = [get()]
+            while not empty():
+                requests.append(get())
+            for request in requests:
+                if request is None:
+                    running = False
+                    break
+                fd, data = request
+                if data is not None:
+                    pending.setdefault(fd, []).append(data)
+                    continue
+                # write what is queued for the file before closing it
+                self._write_chunks(fd, pending.pop(fd, []))
+                self._close(fd)
+            for fd, chunks in pending.items():
+                self._write_chunks(fd, chunks)
+
+    @staticmethod
+    def _write_chunks(fd: int, chunks: List[bytearray]) -> None:
+        """Write the chunks to the file in order, emptying them."""
+        try:
+            if chunks and _HAS_WRITEV:
+                written = os.writev(fd, chunks)
+                # os.writev may write less than it was given, the rest is written below
+                for chunk in chunks:
+                    size = len(chunk)
+                    del chunk[:written]
+                    written = max(written - size, 0)
+            for chunk in chunks:
+                while chunk:
+                    # os.write may write less than it was given
+                    del chunk[: os.write(fd, chunk)]
+        except OSError:
+            logging.getLogger(__name__).exception("Unable to write data file")
+
+    @staticmethod
+    def _close(fd: int) -> None:
+        """Sync the file to disk and close it."""
+        try:
+            _sync(fd)
+        except OSError:
+            logging.getLogger(__name__).exception("Unable to sync data file")
+        try:
+            os.close(fd)
+        except OSError:
+            logging.getLogger(__name__).exception("Unable to close data file")
 
     def filename_from_data(self, data: CellDataRow) -> str:
-        """Create a filename from the data."""
-        root = self.config.data_path
-        cell_name = self.config.cell_names[data.cell_index]
-        experiment_name = self.config.experiment_name
-        filename = ""
-        if self.config.prefix:
-            filename += f"{self.config.prefix}_"
-        filename += f"{experiment_name}_{cell_name}"
-        if self.config.suffix:
-            filename += f"_{self.config.suffix}"
+        """Create a filename from the data.
+
+        The parts taken from the config are turned into a filename template once
+        per experiment, the config can only change between experiments.
+        """
+        if self._name_parts is None:
+            config = self.config
+            prefix = f"{config.prefix}_" if config.prefix else ""
+            suffix = f"_{config.suffix}" if config.suffix else ""
+            fixed = [
+                part.replace("{", "{{").replace("}", "}}")
+                for part in (prefix, config.experiment_name, suffix)
+            ]
+            self._name_parts = (
+                config.data_path,
+                f"{fixed[0]}{fixed[1]}_{{cell}}{fixed[2]}_{{sweep}}.csv",
+                config.cell_names,
+            )
+        root, name_fmt, cell_names = self._name_parts
 
         #if data.state == SequentialState.stability_sweep:
          #   filename += f"_stability_sweep_{self.stability_sweep_index}"
 
-        filename += f"_{data.sweep_index}.csv"
-        return root / filename
+        return root / name_fmt.format(
+            cell=cell_names[data.cell_index], sweep=data.sweep_index
+        )
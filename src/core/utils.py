@@ -6,10 +6,23 @@ from typing import Dict, List
 import json
 from sys import stdout
 from pathlib import Path
-from typing import Optional, Union, Tuple
-from collections import UserDict
+from typing import ClassVar, Optional, Union, Tuple
+from collections import UserDict, defaultdict
+from functools import cached_property
 
-from dataclasses import dataclass, field
+from dataclasses import MISSING, dataclass, field, fields
+
+# orjson is optional, it is only used to speed up saving and loading configs
+try:
+    import orjson
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_dumps = json.dumps
+    _json_loads = json.loads
 
 
 def setup_logger(
@@ -47,35 +60,91 @@ class bidict(dict):
     This class is a dictionary that allows for bidirectional lookups. It is
     used to store the mapping between the cell names and the multiplexer
     addresses.
+
+    The keys of each value are kept in ``inverse`` as a dict used as an ordered
+    set, so updates remove keys in constant time and the insertion order is kept.
     """
     def __init__(self, *args, **kwargs):
         super(bidict, self).__init__(*args, **kwargs)
-        self.inverse = {}
+        if len(args) == 1 and not kwargs and isinstance(args[0], bidict):
+            # copying a bidict, its inverse is already built
+            self.inverse = {value: dict(keys) for value, keys in args[0].inverse.items()}
+            return
+        inverse = defaultdict(dict)
         for key, value in self.items():
-            self.inverse.setdefault(value, []).append(key)
+            inverse[value][key] = None
+        self.inverse = dict(inverse)
 
     def __setitem__(self, key, value):
         if key in self:
-            self.inverse[self[key]].remove(key)
+            self.inverse[self[key]].pop(key, None)
         super(bidict, self).__setitem__(key, value)
-        self.inverse.setdefault(value, []).append(key)
+        self.inverse.setdefault(value, {})[key] = None
 
     def __delitem__(self, key):
-        self.inverse.setdefault(self[key], []).remove(key)
-        if self[key] in self.inverse and not self.inverse[self[key]]:
-            del self.inverse[self[key]]
+        value = self[key]
+        keys = self.inverse.get(value)
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self.inverse[value]
         super(bidict, self).__delitem__(key)
 
+    def inverse_last(self, value, default=None):
+        """Get the key most recently mapped to a value
+
+        Args:
+            value: The value to look up
+            default: Returned when no key maps to the value
+        """
+        keys = self.inverse.get(value)
+        if not keys:
+            return default
+        return next(reversed(keys))
+
 
 class JSONCodable(JSONEncoder, JSONDecoder):
-    """A class for encoding and decoding JSON data."""
+    """A class for encoding and decoding JSON data.
+
+    Subclasses are dataclasses, their fields are what gets encoded.
+    """
     def to_json(self):
-        return json.dumps(self.__dict__)
+        return _json_dumps({name: getattr(self, name) for name in self._json_field_names()})
+
+    @classmethod
+    def _json_field_names(cls) -> Tuple[str, ...]:
+        """The names of the dataclass fields, looked up once per class"""
+        names = cls.__dict__.get("_json_fields")
+        if names is None:
+            names = tuple(f.name for f in fields(cls))
+            cls._json_fields = names
+        return names
 
     @classmethod
     def from_json(cls, json_str):
-        data = json.loads(json_str)
-        return cls(**data)
+        """Create an instance from JSON without going through the dataclass __init__
+
+        Fields missing from the JSON, such as fields added since it was saved, get
+        their defaults like they would from __init__.
+        """
+        data = _json_loads(json_str)
+        names = cls._json_field_names()
+        unknown = data.keys() - set(names)
+        if unknown:
+            raise TypeError(f"Unknown fields for {cls.__name__}: {', '.join(sorted(unknown))}")
+        if len(data) < len(names):
+            for f in fields(cls):
+                if f.name in data:
+                    continue
+                if f.default is not MISSING:
+                    data[f.name] = f.default
+                elif f.default_factory is not MISSING:
+                    data[f.name] = f.default_factory()
+                else:
+                    raise TypeError(f"Missing field for {cls.__name__}: {f.name}")
+        obj = cls.__new__(cls)
+        obj.__dict__.update(data)
+        return obj
 
 
 @dataclass
@@ -130,33 +199,66 @@ class Config(JSONCodable):
     stability_wait_time:int = field(default=0)
     #num_loops:int = field(default=4) # here is where you define the amount of loops 
 
+    # The shared instance. It is only ever updated in place by set_instance, so a
+    # reference obtained from get_instance stays valid for the whole process.
+    _instance: ClassVar[Optional["Config"]] = None
+
+    # The bidicts returned by channel_mapping and reference_mapping, each with a copy
+    # of the mapping it was built from. Kept on the class so that they stay out of
+    # __dict__, which to_json and set_instance work on.
+    _bidict_cache: ClassVar[Dict[str, Tuple[Dict[str, str], bidict]]] = {}
+
     @property
     def channel_mapping(self) -> bidict:
-        return bidict(**self.cell_channel_mapping)
+        return self._cached_bidict("cell_channel_mapping")
 
     @property
     def reference_mapping(self) -> bidict:
-        return bidict(**self.reference_channel_mapping)
+        return self._cached_bidict("reference_channel_mapping")
 
-    @property
+    def _cached_bidict(self, name: str) -> bidict:
+        """Get a bidict of a mapping, only rebuilding it when the mapping has changed
+
+        The mappings are edited in place, so the cache is checked against a copy of
+        the mapping. Comparing dicts is much cheaper than rebuilding the inverse.
+        The returned bidict is shared and must not be modified.
+
+        Args:
+            name (str): The name of the mapping attribute
+        """
+        mapping = getattr(self, name)
+        cached = Config._bidict_cache.get(name)
+        if cached is None or cached[0] != mapping:
+            cached = Config._bidict_cache[name] = (dict(mapping), bidict(**mapping))
+        return cached[1]
+
+    @cached_property
     def data_path(self) -> Path:
         return Path(self.data_root)
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name == "data_root":
+            # data_path is cached in the instance __dict__
+            self.__dict__.pop("data_path", None)
+
     @classmethod
     def get_instance(cls) -> "Config":
-        if not hasattr(cls, "_instance"):
-            cls._instance = cls()
-        return cls._instance
+        instance = cls._instance
+        if instance is None:
+            instance = cls._instance = cls()
+        return instance
 
     @classmethod
     def set_instance(cls, config: "Config") -> None:
-        if not hasattr(cls, "_instance"):
+        if cls._instance is None:
             cls._instance = config
         else:
             cls._instance.__dict__.update(config.__dict__)
+            cls._instance.__dict__.pop("data_path", None)
 
 
-@dataclass
+@dataclass(slots=True)
 class CellDataRow:
     time: float
     state: str
@@ -168,20 +270,10 @@ class CellDataRow:
     drain_current: float
   #  loop_count: int 
 
-    @property
-    def header(self) -> List[str]:
-        return [
-            "Time",
-            "Drain Voltage",
-            "Gate Voltage",
-            "Drain Current",
-        ]
-
-    @staticmethod
-    def data_as_list(data: "CellDataRow") -> List:
-        return [
-            data.time,
-            data.drain_voltage,
-            data.gate_voltage,
-            data.drain_current,
-        ]
+    # the columns written to the data files
+    HEADER: ClassVar[Tuple[str, ...]] = (
+        "Time",
+        "Drain Voltage",
+        "Gate Voltage",
+        "Drain Current",
+    )
@@ -1,5 +1,5 @@
 from collections import defaultdict
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, Signal, Slot
 from PySide6.QtWidgets import (
     QLabel,
     QLineEdit,
@@ -10,6 +10,7 @@ from PySide6.QtWidgets import (
 )
 from multiprocessing.synchronize import Event
 from multiprocessing import Queue
+from queue import Empty
 from typing import Union, Coroutine, Tuple
 from pathlib import Path
 
@@ -58,6 +59,7 @@ class ContentControlsViewModel(QObject):
 
         self.instrument_panel_visible = True
 
+    @Slot()
     def experiment_toggle(self):
         if self.instrument_panel_visible:
             self.view.experimentSettingsFrame.setDisabled(True)
@@ -75,6 +77,7 @@ class ContentControlsViewModel(QObject):
             self.monitor_panel.setDisabled(False)
             self.monitor_pannel_visible = True
 
+    @Slot()
     def save_config(self):
         options = QFileDialog.Options()
         filename, _ = QFileDialog.getSaveFileName(
@@ -91,6 +94,7 @@ class ContentControlsViewModel(QObject):
         with open(filename, "w") as f:
             f.write(json_string)
 
+    @Slot()
     def load_config(self):
         options = QFileDialog.Options()
         filename, _ = QFileDialog.getOpenFileName(
@@ -108,6 +112,7 @@ class ContentControlsViewModel(QObject):
         Config.set_instance(config)
         self.trigger_reload.emit()
 
+    @Slot()
     def set_data_folder(self):
         options = QFileDialog.Options()
         folder = QFileDialog.getExistingDirectory(
@@ -118,26 +123,33 @@ class ContentControlsViewModel(QObject):
         Path(folder).mkdir(parents=True, exist_ok=True)
         Config.get_instance().data_root = str(folder)
 
+    @Slot()
     def set_filename_fix(self):
 
         # open a dialog to get the prefix and suffix
         prefix = create_input_dialog("Enter the prefix for the filename")
         suffix = create_input_dialog("Enter the suffix for the filename")
-        Config.get_instance().prefix = prefix
-        Config.get_instance().suffix = suffix
+        config = Config.get_instance()
+        config.prefix = prefix
+        config.suffix = suffix
 
+    @Slot()
     def set_vds_sweep_mode(self):
         Config.get_instance().reverse = True
 
+    @Slot()
     def set_vgs_sweep_mode(self):
         Config.get_instance().reverse = False
 
+    @Slot()
     def set_simple_sampling_mode(self):
         Config.get_instance().sampling_mode = "simple"
 
+    @Slot()
     def set_stable_mean_sampling_mode(self):
         Config.get_instance().sampling_mode = "stable"
 
+    @Slot()
     def set_mean_sampling_mode(self):
         Config.get_instance().sampling_mode = "mean"
 
@@ -180,6 +192,7 @@ class ExperimentControlsViewModel(QObject):
         self.pause_resume_event = pause_resume_event
         self.paused = False
         self.data_queue = data_queue
+        self.data_callback_thread = None
         self.running = False
 
         # UI Components
@@ -243,18 +256,17 @@ class ExperimentControlsViewModel(QObject):
 
         """
 
-        drain_text.setText(str(Config.get_instance().drain_voltage))
-        ids_text.setText(str(Config.get_instance().drain_current_limit))
-        igs_text.setText(str(Config.get_instance().gate_current_limit))
-        start_text.setText(str(Config.get_instance().start_voltage))
-        end_text.setText(str(Config.get_instance().end_voltage))
-        step_text.setText(str(Config.get_instance().voltage_step))
-        experiment_name.setText(Config.get_instance().experiment_name)
-        sweep_spin.setValue(Config.get_instance().num_sweeps)
-        stability_threshold.setText(
-            str(Config.get_instance().stability_threshold * 100)
-        )
-        stability_wait_time.setText(str(Config.get_instance().stability_wait_time))
+        config = Config.get_instance()
+        drain_text.setText(str(config.drain_voltage))
+        ids_text.setText(str(config.drain_current_limit))
+        igs_text.setText(str(config.gate_current_limit))
+        start_text.setText(str(config.start_voltage))
+        end_text.setText(str(config.end_voltage))
+        step_text.setText(str(config.voltage_step))
+        experiment_name.setText(config.experiment_name)
+        sweep_spin.setValue(config.num_sweeps)
+        stability_threshold.setText(str(config.stability_threshold * 100))
+        stability_wait_time.setText(str(config.stability_wait_time))
 
     def handle_experiment_ending(self, data: CellDataRow):
         self.start_trigger.emit()
@@ -271,6 +283,7 @@ class ExperimentControlsViewModel(QObject):
     def handle_receive_waiting_state(self, data: CellDataRow):
         self.waitStateReceived.emit()
 
+    @Slot()
     def handle_start_signal(self):
         self.running = not self.running
         self.start_button.setDisabled(self.running)
@@ -299,6 +312,7 @@ class ExperimentControlsViewModel(QObject):
         threshold_text.setStyleSheet("color: black")
         Config.get_instance().stability_threshold = threshold / 100
 
+    @Slot(int)
     def set_num_sweeps(self, value: int) -> None:
         Config.get_instance().num_sweeps = value
 
@@ -363,9 +377,24 @@ class ExperimentControlsViewModel(QObject):
         igs_current_limit.setStyleSheet("color: black")
         Config.get_instance().gate_current_limit = current
 
+    @Slot()
     def start_experiment(self) -> None:
         self.start_trigger.emit()
+        previous = self.data_callback_thread
+        if previous is not None and previous.is_alive():
+            # the previous run has to end and its data thread finish writing first,
+            # otherwise both threads would read the new run's data
+            self.data_collection_shutdown.set()
+            previous.join()
         self.data_collection_shutdown.clear()
+        # a data thread that stopped waiting on an earlier run can leave messages behind
+        try:
+            while True:
+                self.data_queue.get_nowait()
+        except Empty:
+            pass
+        # The experiment process opens the multiplexer itself, so release ours.
+        self.mux_class.close_sessions()
         # Starting the Data Collection Callbacks
         self.data_callback_thread = DataCallBackThread(
             self.data_queue,
@@ -375,7 +404,8 @@ class ExperimentControlsViewModel(QObject):
         self.data_callback_thread.start()
 
         # We can start a separate process to run the experiment here.
-        if Config.get_instance().reverse:
+        config = Config.get_instance()
+        if config.reverse:
             experiment_class = ReversedSequentialEGFETExperiment
         else:
             experiment_class = SequentialEFGETExperiment
@@ -389,12 +419,18 @@ class ExperimentControlsViewModel(QObject):
             shutdown=self.data_collection_shutdown,
             pause_resume_event=self.pause_resume_event,
             data_queue=self.data_queue,
-            config=Config.get_instance(),
+            config=config,
             sampling_strategy=SimpleSamplingStrategy,
         )
-        self.supervisor.start()
+        try:
+            self.supervisor.start()
+        except Exception:
+            # nothing will end the data stream, let the data thread stop
+            self.data_collection_shutdown.set()
+            raise
         self.user_event_trigger.set()
 
+    @Slot()
     def stop_experiment(self):
         # We can stop the experiment here.
         self.start_trigger.emit()
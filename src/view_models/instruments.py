@@ -3,12 +3,32 @@ from PySide6.QtCore import QObject, Signal, Slot
 from PySide6.QtWidgets import QAbstractButton, QTableWidget
 from PySide6.QtWidgets import QTableWidgetItem
 from pathlib import Path
-from typing import List, Optional, Callable, Tuple
-import pyvisa
+from typing import Dict, List, Optional, Callable, Tuple
 
 
 from core.utils import Config, bidict
-from core.devices import Multiplexer, SourceMeter, AbstractDevice, MockMultiplexer
+from core.devices import (
+    Multiplexer,
+    SourceMeter,
+    AbstractDevice,
+    MockMultiplexer,
+    list_resources,
+)
+
+
+def _table_order(row: Tuple[str, str]) -> Tuple[bool, int]:
+    """Sort key putting channels with a role first, each group by channel number"""
+    channel, role = row
+    return role == "Undefined", int(channel[2:])
+
+
+def _set_cell_text(table: QTableWidget, row: int, column: int, text: str) -> None:
+    """Set the text of a table cell, reusing its item if it has one"""
+    item = table.item(row, column)
+    if item is None:
+        table.setItem(row, column, QTableWidgetItem(text))
+    elif item.text() != text:
+        item.setText(text)
 
 
 @dataclass
@@ -41,49 +61,52 @@ class InstrumentPanelViewModel(QObject):
     def __init__(self, mock: bool = False):
         super().__init__()
         self.mock = mock
+        # (cell mapping, reference mapping, role of each mapped channel)
+        self._role_cache: Optional[Tuple[bidict, bidict, Dict[str, str]]] = None
+        self.devices: List[str] = []
         self.request_refresh()
         if self.mock:
             self.mux = MockMultiplexer.get_instance("")
         else:
-            mux_addr = (
-                Config.get_instance().mux_address
-                if Config.get_instance().mux_address
-                else "PXI1Slot2"
-            )
+            mux_addr = Config.get_instance().mux_address or "PXI1Slot2"
             self.mux = Multiplexer.get_instance(mux_addr)
 
     @property
     def friendly_topology_name(self) -> str:
         mux_top = self.mux.topology
-        friendly_top = self.topology_map.inverse.get(mux_top, [""])[-1]
+        friendly_top = self.topology_map.inverse_last(mux_top, "")
         return friendly_top.title()
 
     def get_gpib_devices(self) -> List[str]:
         if self.mock:
             return ["GPIB0::1::INSTR_Mock", "GPIB0::2::INSTR_Mock"]
-        resources = pyvisa.ResourceManager().list_resources()
-        return [str(r) for r in resources]
+        return list_resources()
 
+    @Slot()
     def request_refresh(self) -> None:
-        self.devices = self.get_gpib_devices()
-        self.devicesChanged.emit(self.devices)
+        """Update the list of devices, devicesChanged is only emitted if it changed"""
+        devices = self.get_gpib_devices()
+        if devices != self.devices:
+            self.devices = devices
+            self.devicesChanged.emit(devices)
 
     def set_vds_source(self, vds_source: str) -> None:
         Config.get_instance().vds_address = vds_source
         self.vdsSourceChanged.emit(vds_source)
 
     def set_vgs_source(self, vgs_source: str) -> None:
-        Config.get_instance().vgs_address = vgs_source
-        Config.get_instance().vgs_channel = "com0"
+        config = Config.get_instance()
+        config.vgs_address = vgs_source
+        config.vgs_channel = "com0"
         self.vgsSourceChanged.emit(vgs_source)
         self.tableChanged.emit()
 
+    @Slot()
     def remove_last_added_cell(self) -> None:
-        cell_name = Config.get_instance().cell_names.pop()
-        if cell_name in Config.get_instance().cell_channel_mapping:
-            Config.get_instance().cell_channel_mapping.pop(cell_name)
-        if cell_name in Config.get_instance().reference_channel_mapping:
-            Config.get_instance().reference_channel_mapping.pop(cell_name)
+        config = Config.get_instance()
+        cell_name = config.cell_names.pop()
+        config.cell_channel_mapping.pop(cell_name, None)
+        config.reference_channel_mapping.pop(cell_name, None)
         self.tableChanged.emit()
 
     def get_mux_info(self) -> str:
@@ -91,28 +114,49 @@ class InstrumentPanelViewModel(QObject):
             return self.mux.get_device_info()
 
     def get_mux_channels(self) -> List[str]:
+        """Get the channels of the multiplexer for its current topology.
+
+        The multiplexer caches the channels until its topology changes, and
+        reuses its pooled session, so this is cheap after the first call.
+        """
         with self.mux:
             return self.mux.get_channels()
 
+    def channel_roles(self) -> Dict[str, str]:
+        """Get the role of each channel that is mapped to a cell.
+
+        A channel used as a cell's input is named after the cell, otherwise a
+        channel used as a reference is named after the cell with " Reference".
+        The config returns the same mappings until they are changed, so the roles
+        are only rebuilt then.
+
+        Returns:
+            Dict[str, str]: The role of each mapped channel
+        """
+        config = Config.get_instance()
+        cell_roles = config.channel_mapping
+        reference_roles = config.reference_mapping
+        cached = self._role_cache
+        if cached is None or cached[0] is not cell_roles or cached[1] is not reference_roles:
+            roles = {
+                channel: f"{reference_roles.inverse_last(channel)} Reference"
+                for channel in reference_roles.inverse
+                if reference_roles.inverse[channel]
+            }
+            for channel, cells in cell_roles.inverse.items():
+                if cells:
+                    roles[channel] = cell_roles.inverse_last(channel)
+            cached = self._role_cache = (cell_roles, reference_roles, roles)
+        return cached[2]
+
     def get_channel_connection_display_data(self) -> List[Tuple[str, str]]:
-        with self.mux:
-            channels = self.mux.get_channels()
-        channel_data = []
-        for channel in channels:
-            if "com" in channel:
-                continue
-            role = Config.get_instance().channel_mapping.inverse.get(
-                channel, ["Undefined"]
-            )[-1]
-            if role == "Undefined":
-                role = Config.get_instance().reference_mapping.inverse.get(
-                    channel, ["Undefined"]
-                )[-1]
-                if role != "Undefined":
-                    role = f"{role} Reference"
-            channel_data.append((channel, role))
-
-        return channel_data
+        channels = self.get_mux_channels()
+        roles = self.channel_roles()
+        return [
+            (channel, roles.get(channel, "Undefined"))
+            for channel in channels
+            if "com" not in channel
+        ]
 
     @Slot(QAbstractButton)
     def update_topology(self, sender: QAbstractButton):
@@ -124,44 +168,41 @@ class InstrumentPanelViewModel(QObject):
         # A change in topology implies something is different
         # best to reset to a new state
         self.mux.topology = topology
-        Config.get_instance().mux_address = self.mux._name
-        Config.get_instance().mux_topology = topology
-        Config.get_instance().cell_names = []
-        Config.get_instance().cell_channel_mapping = dict()
-        Config.get_instance().reference_channel_mapping = dict()
+        config = Config.get_instance()
+        config.mux_address = self.mux._name
+        config.mux_topology = topology
+        config.cell_names = []
+        config.cell_channel_mapping = dict()
+        config.reference_channel_mapping = dict()
         self.tableChanged.emit()
 
     def update_table(self, table: QTableWidget) -> None:
-        table.clear()
-        table.setHorizontalHeaderLabels(["Channel", "Connection"])
+        """Fill the table with the channels and their roles.
+
+        The items already in the table are reused, only the rows that are added
+        get new items. Repainting is held off until every row is set, so the
+        table is redrawn once.
+
+        Args:
+            table: The table showing the channel connections
+        """
+        config = Config.get_instance()
+        table_data = sorted(self.get_channel_connection_display_data(), key=_table_order)
         # Com channels first
-        offset = 0
-        if "None" not in Config.get_instance().vgs_address:
-            table.setItem(
-                offset, 0, QTableWidgetItem(Config.get_instance().vgs_channel)
-            )
-            table.setItem(
-                offset, 1, QTableWidgetItem(Config.get_instance().vgs_address)
-            )
-            offset += 1
-        table_data = self.get_channel_connection_display_data()
-        with_role, without_role = [], []
-        for channel, role in table_data:
-            if role != "Undefined":
-                with_role.append((channel, role))
-            else:
-                without_role.append((channel, role))
-        with_role = sorted(with_role, key=lambda x: int(x[0][2:]))
-        without_role = sorted(without_role, key=lambda x: int(x[0][2:]))
-        table_data = with_role + without_role
-        for i, (channel, role) in enumerate(table_data):
-            table.setItem(i + offset, 0, QTableWidgetItem(channel))
-            table.setItem(i + offset, 1, QTableWidgetItem(role))
-            if "com" in channel:
-                continue
+        if "None" not in config.vgs_address:
+            table_data.insert(0, (config.vgs_channel, config.vgs_address))
+        table.setUpdatesEnabled(False)
+        try:
+            table.setRowCount(len(table_data))
+            for i, (channel, role) in enumerate(table_data):
+                _set_cell_text(table, i, 0, channel)
+                _set_cell_text(table, i, 1, role)
+        finally:
+            table.setUpdatesEnabled(True)
 
     def handle_reload_from_file(self):
         self.request_refresh()
-        self.vdsSourceChanged.emit(Config.get_instance().vds_address)
-        self.vgsSourceChanged.emit(Config.get_instance().vgs_address)
+        config = Config.get_instance()
+        self.vdsSourceChanged.emit(config.vds_address)
+        self.vgsSourceChanged.emit(config.vgs_address)
         self.tableChanged.emit()
@@ -1,44 +1,67 @@
 import asyncio
+import math
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from PySide6.QtCore import QObject, Signal
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
 from PySide6.QtWidgets import QLabel, QProgressBar
-from pyqtgraph import PlotWidget, mkPen, PlotItem, plot
+from pyqtgraph import PlotWidget, mkPen, PlotItem, PlotDataItem, plot
 import pyqtgraph as pg
 import numpy as np
 from threading import Thread
 from multiprocessing import Queue, Event
-from typing import List, Tuple, Dict
+from typing import Deque, List, Optional, Tuple, Dict
 
 from core.utils import Config, CellDataRow
 from core.event_handling import AbstractDataCallBack
 from core.experiment import SequentialState
 
 
-def sequence(c, z=0):
-    while True:
-        yield z
-        z = z**2 + c
-
+def grid_axes(xmin, xmax, ymin, ymax, pixel_density):
+    """Get the real and imaginary axes of a grid over the complex plane"""
+    re = np.linspace(xmin, xmax, int((xmax - xmin) * pixel_density))
+    im = np.linspace(ymin, ymax, int((ymax - ymin) * pixel_density))
+    return re, im
 
-def mandelbrot(candidate):
-    return sequence(z=0, c=candidate)
 
+def complex_matrix(xmin, xmax, ymin, ymax, pixel_density):
+    re, im = grid_axes(xmin, xmax, ymin, ymax, pixel_density)
+    return re[np.newaxis, :] + im[:, np.newaxis] * 1j
 
-def julia(candidate, parameter):
-    return sequence(z=candidate, c=parameter)
 
+def stable_mask(re, im, num_iterations):
+    """Check which points re + im*j stay bounded under num_iterations of z = z**2 + c.
 
-def complex_matrix(xmin, xmax, ymin, ymax, pixel_density):
-    re = np.linspace(xmin, xmax, int((xmax - xmin) * pixel_density))
-    im = np.linspace(ymin, ymax, int((ymax - ymin) * pixel_density))
-    return re[np.newaxis, :] + im[:, np.newaxis] * 1j
+    The real and imaginary parts are kept in separate float arrays, broadcast
+    against each other, so a grid can be given by its two axes. Points are dropped
+    from the iteration as soon as they escape, |z| > 2 means the sequence diverges.
+    """
+    re, im = np.broadcast_arrays(np.asarray(re, dtype=float), np.asarray(im, dtype=float))
+    stable = np.ones(re.shape, dtype=bool)
+    stable_flat = stable.reshape(-1)
+    index = np.arange(re.size)
+    c_re = re.reshape(-1)
+    c_im = im.reshape(-1)
+    z_re = np.zeros(re.size)
+    z_im = np.zeros(re.size)
+    for _ in range(num_iterations):
+        z_re, z_im = z_re * z_re - z_im * z_im + c_re, 2 * z_re * z_im + c_im
+        escaped = z_re * z_re + z_im * z_im > 4
+        if escaped.any():
+            stable_flat[index[escaped]] = False
+            bounded = ~escaped
+            index = index[bounded]
+            c_re = c_re[bounded]
+            c_im = c_im[bounded]
+            z_re = z_re[bounded]
+            z_im = z_im[bounded]
+            if not index.size:
+                break
+    return stable
 
 
 def is_stable(c, num_iterations):
-    z = 0
-    for _ in range(num_iterations):
-        z = z**2 + c
-    return abs(z) <= 2
+    c = np.asarray(c, dtype=complex)
+    return stable_mask(c.real, c.imag, num_iterations)
 
 
 def get_members(c, num_iterations):
@@ -46,33 +69,96 @@ def get_members(c, num_iterations):
     return c[mask]
 
 
+# (real, imag) of the points drawn before the first data arrives, computed once
+_SPLASH_XY: Tuple[np.ndarray, np.ndarray] | None = None
+
+
+def splash_points() -> Tuple[np.ndarray, np.ndarray]:
+    """Get the points of the Mandelbrot set drawn as a placeholder plot.
+
+    The set is computed the first time a monitor is created and reused afterwards.
+    """
+    global _SPLASH_XY
+    if _SPLASH_XY is None:
+        re, im = grid_axes(-1.5, 0.5, -1, 1, 200)
+        re, im = np.broadcast_arrays(re[np.newaxis, :], im[:, np.newaxis])
+        mask = stable_mask(re, im, 200)
+        _SPLASH_XY = (re[mask], im[mask])
+    return _SPLASH_XY
+
+
+# number of points of each cell shown on the live plot
+PLOT_HISTORY = 500
+# milliseconds between live plot updates
+PLOT_INTERVAL = 33
+
+
+# SI prefixes and their factors, from yocto to yotta
+_SI_PREFIXES = ("y", "z", "a", "f", "p", "n", "µ", "m", "", "k", "M", "G", "T", "P", "E", "Z", "Y")
+_SI_FACTORS = (
+    1e-24, 1e-21, 1e-18, 1e-15, 1e-12, 1e-9, 1e-6, 1e-3, 1e0,
+    1e3, 1e6, 1e9, 1e12, 1e15, 1e18, 1e21, 1e24,
+)
+# index of the base unit
+_SI_OFFSET = 8
+
+
 def convert_to_si_unit(value):
-    si_prefixes = [
-        (1e-24, "y"),  # yocto
-        (1e-21, "z"),  # zepto
-        (1e-21, "z"),  # zepto
-        (1e-18, "a"),  # atto
-        (1e-15, "f"),  # femto
-        (1e-12, "p"),  # pico
-        (1e-9, "n"),  # nano
-        (1e-6, "µ"),  # micro
-        (1e-3, "m"),  # milli
-        (1e0, ""),  # base unit
-        (1e3, "k"),  # kilo
-        (1e6, "M"),  # mega
-        (1e9, "G"),  # giga
-        (1e12, "T"),  # tera
-        (1e15, "P"),  # peta
-        (1e18, "E"),  # exa
-        (1e21, "Z"),  # zetta
-        (1e24, "Y"),  # yotta
-    ]
+    """Scale a value to the largest SI prefix that keeps it at least 1.
 
+    Values too small for any prefix are returned as they are.
+    """
     abs_value = abs(value)
-    for factor, prefix in reversed(si_prefixes):
-        if abs_value >= factor:
-            return value / factor, prefix
-    return value, ""  # In case the value is extremely small
+    if not abs_value >= 1e-24:
+        return value, ""
+    if abs_value >= 1e24:
+        index = len(_SI_FACTORS) - 1
+    else:
+        index = math.floor(math.log10(abs_value)) // 3 + _SI_OFFSET
+        # log10 may round across a power of ten
+        if abs_value < _SI_FACTORS[index]:
+            index -= 1
+        elif abs_value >= _SI_FACTORS[index + 1]:
+            index += 1
+    return value / _SI_FACTORS[index], _SI_PREFIXES[index]
+
+
+class CurveBuffer:
+    """The latest PLOT_HISTORY points of a curve, kept in preallocated arrays.
+
+    The arrays hold twice as many points, so the latest points are always one
+    contiguous slice. Once the arrays are full the points still shown are moved
+    to the front, at most once every PLOT_HISTORY points.
+    """
+
+    __slots__ = ("x", "y", "size")
+
+    def __init__(self) -> None:
+        self.x = np.empty(2 * PLOT_HISTORY)
+        self.y = np.empty(2 * PLOT_HISTORY)
+        self.size = 0
+
+    def extend(self, xs: List[float], ys: List[float]) -> None:
+        count = len(xs)
+        if count > PLOT_HISTORY:
+            xs = xs[-PLOT_HISTORY:]
+            ys = ys[-PLOT_HISTORY:]
+            count = PLOT_HISTORY
+        size = self.size
+        if size + count > len(self.x):
+            # keep the points that are still shown after adding the new ones
+            keep = PLOT_HISTORY - count
+            self.x[:keep] = self.x[size - keep : size]
+            self.y[:keep] = self.y[size - keep : size]
+            size = keep
+        self.x[size : size + count] = xs
+        self.y[size : size + count] = ys
+        self.size = size + count
+
+    def latest(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Get views of the points to show"""
+        start = max(self.size - PLOT_HISTORY, 0)
+        return self.x[start : self.size], self.y[start : self.size]
 
 
 class MonitorViewModel(QObject):
@@ -85,20 +171,16 @@ class MonitorViewModel(QObject):
 
     update_latest_text = Signal(float)
     update_percentage_complete = Signal(int)
-    update_plot_signal = Signal(int, float, float)
     update_current_state = Signal(str, int)
 
     def __init__(self, plot_widget: PlotWidget) -> None:
         super().__init__()
         self.plot_widget = plot_widget
         # Initialize the plot
-        c = complex_matrix(-1.5, 0.5, -1, 1, 200)
-        members = get_members(c, 200)
-        # blue pen
-
+        splash_x, splash_y = splash_points()
         self.plot_widget.plot(
-            members.real,
-            members.imag,
+            splash_x,
+            splash_y,
             pen=None,
             symbol="o",
             symbolPen="k",
@@ -114,8 +196,16 @@ class MonitorViewModel(QObject):
         # Set the grid
         self.plot_widget.showGrid(x=True, y=True)
         self.plot_widget.show()
-        self.data: Dict[int, Tuple[PlotItem, List[float], List[float]]] = dict()
+        # the curve of each cell and the points it shows
+        self.data: Dict[int, Tuple[PlotDataItem, CurveBuffer]] = dict()
         self.iteration = 0
+        # (number of sweep points, whether the drain voltage is swept) of the
+        # running experiment, taken from the config at its first sweep point
+        self._run_info: Optional[Tuple[int, bool]] = None
+        # last percentage and (state, cell index) emitted, the view is only updated
+        # when they change
+        self._last_percentage: Optional[int] = None
+        self._last_state: Optional[Tuple[str, int]] = None
         self.pens = [
             mkPen(color="k", width=2),
             mkPen(color="r", width=2),
@@ -125,31 +215,77 @@ class MonitorViewModel(QObject):
             mkPen(color="m", width=2),
             mkPen(color="y", width=2),
         ]
+        # (cell index, x, y) of the points to plot, None to start a new plot. Filled
+        # by the data callback thread and emptied by the plot timer, deque appends
+        # and pops are thread safe.
+        self._pending: Deque[Tuple[int, float, float] | None] = deque()
+        # the latest drain current, shown by the plot timer as well
+        self._latest_current: Deque[float] = deque(maxlen=1)
+        self.plot_timer = QTimer(self)
+        self.plot_timer.setInterval(PLOT_INTERVAL)
+        self.plot_timer.timeout.connect(self.flush_plot)
+        self.plot_timer.start()
 
     def update_current_state_text(
         self, QLabel: QLabel, state: str, cell_index: int
     ) -> None:
-        if cell_index >= len(Config.get_instance().cell_names):
+        cell_names = Config.get_instance().cell_names
+        if cell_index >= len(cell_names):
             cell_name = "(End)"
         else:
-            cell_name = f"({Config.get_instance().cell_names[cell_index]})"
+            cell_name = f"({cell_names[cell_index]})"
         QLabel.setText(f"State: {state} with cell {cell_name}")
 
     def update_data(self, index: int, x: float, y: float) -> None:
-        gate_voltages, drain_currents = self.data.get(index, ([], []))
-        gate_voltages.append(x)
-        drain_currents.append(y)
-        self.data[index] = (gate_voltages, drain_currents)
-
-        self.plot_widget.clear()
-        for index, (x, y) in self.data.items():
-            cell_name = Config.get_instance().cell_names[index]
-            if len(x) > 100:
-                x = x[-500:]
-                y = y[-500:]
-            pen = self.pens[index % len(self.pens)]
-            self.plot_widget.plot(x, y, pen=pen, name=cell_name)
-        self.plot_widget.show()
+        """Add a point to the curve of a cell"""
+        self._update_curves({index: ([x], [y])})
+
+    @Slot()
+    def flush_plot(self) -> None:
+        """Add the points received since the last call to the plot.
+
+        Called by the plot timer, so the plot and the latest value are redrawn at
+        most once per PLOT_INTERVAL however fast the data arrives.
+        """
+        if self._latest_current:
+            self.update_latest_text.emit(self._latest_current.popleft())
+        pending = self._pending
+        points: Dict[int, Tuple[List[float], List[float]]] = {}
+        # only take what is queued now, the data callback thread keeps adding
+        for _ in range(len(pending)):
+            point = pending.popleft()
+            if point is None:
+                self._update_curves(points)
+                points = {}
+                self.data.clear()
+                continue
+            index, x, y = point
+            xs, ys = points.setdefault(index, ([], []))
+            xs.append(x)
+            ys.append(y)
+        self._update_curves(points)
+
+    def _update_curves(self, points: Dict[int, Tuple[List[float], List[float]]]) -> None:
+        """Add points to the curves of the cells, each showing its latest PLOT_HISTORY points.
+
+        The curve of each cell is created with its first point and updated in
+        place afterwards.
+        """
+        for index, (xs, ys) in points.items():
+            entry = self.data.get(index)
+            if entry is None:
+                if not self.data:
+                    # first point of an experiment, remove the splash and earlier curves
+                    self.plot_widget.clear()
+                cell_name = Config.get_instance().cell_names[index]
+                pen = self.pens[index % len(self.pens)]
+                entry = self.data[index] = (
+                    self.plot_widget.plot([], [], pen=pen, name=cell_name),
+                    CurveBuffer(),
+                )
+            curve, buffer = entry
+            buffer.extend(xs, ys)
+            curve.setData(*buffer.latest())
 
     def update_current_value_text(self, QLabel: QLabel, value: float) -> None:
         value, prefix = convert_to_si_unit(value)
@@ -164,42 +300,49 @@ class MonitorViewModel(QObject):
             data.state == SequentialState.cell_sweep
             #or data.state == SequentialState.stability_sweep
         ):
-            ## Set off the plot update signals
-            y = data.drain_current
-            self.update_latest_text.emit(y)
+            # shown by the plot timer
+            self._latest_current.append(data.drain_current)
 
         if data.state == SequentialState.cell_sweep:
+            if self._run_info is None:
+                # the config does not change while an experiment runs
+                config = Config.get_instance()
+                total_iterations = (
+                    int((config.end_voltage - config.start_voltage) / config.voltage_step)
+                    * len(config.cell_names)
+                    * config.num_sweeps
+                )
+                self._run_info = (total_iterations, config.reverse)
+            total_iterations, reverse = self._run_info
             # calculate remaining percentage
             self.iteration += 1
-            start_voltage = Config.get_instance().start_voltage
-            end_voltage = Config.get_instance().end_voltage
-            step = Config.get_instance().voltage_step
-            num_cells = len(Config.get_instance().cell_names)
-            num_sweeps = Config.get_instance().num_sweeps
-            total_iterations = (
-                int((end_voltage - start_voltage) / step) * num_cells * num_sweeps
-            )
-            self.update_percentage_complete.emit(
-                int((self.iteration / total_iterations) * 100)
-            )
-            if Config.get_instance().reverse:
+            percentage = self.iteration * 100 // total_iterations
+            if percentage != self._last_percentage:
+                self._last_percentage = percentage
+                self.update_percentage_complete.emit(percentage)
+            if reverse:
                 x = data.drain_voltage
                 y = data.drain_current
             else:
                 x = data.gate_voltage
                 y = data.drain_current
-            self.update_plot_signal.emit(data.cell_index, x, y)
+            self._pending.append((data.cell_index, x, y))
 
         if data.state == SequentialState.idle:
-            self.data.clear()
+            self._pending.append(None)
+            self._run_info = None
 
         if data.state == SequentialState.end:
-            self.update_current_state.emit(
-                "Configuring for next experiment", data.cell_index + 1
-            )
+            state = ("Configuring for next experiment", data.cell_index + 1)
         else:
-            self.update_current_state.emit(data.state, data.cell_index)
+            state = (data.state, data.cell_index)
+        if state != self._last_state:
+            self._last_state = state
+            self.update_current_state.emit(*state)
 
     def finalize(self) -> None:
-        self.data.clear()
+        self._pending.append(None)
         self.iteration = 0
+        self._run_info = None
+        self._last_percentage = None
+        self._last_state = None
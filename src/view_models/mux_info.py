@@ -1,5 +1,6 @@
-from itertools import combinations
+from itertools import combinations, product
 from collections import defaultdict
+from typing import Dict, List
 
 from core.devices import Multiplexer
 
@@ -11,6 +12,8 @@ class MuxInfoViewModel:
     """
     def __init__(self):
         self.mux = Multiplexer.get_instance()
+        # connectable channels found for each topology
+        self._connectable: Dict[str, Dict[str, List[str]]] = dict()
 
     def get_mux_info(self):
         return self.mux.get_device_info()
@@ -18,14 +21,28 @@ class MuxInfoViewModel:
     def find_all_connectable_channels(self):
         """Find all connectable channels for the multiplexer device
 
+        The 2524 topologies only route channels to com channels, so when the device
+        has com channels only those pairs are checked. The result is kept for each
+        topology, every check is a driver round-trip.
+
         Returns:
             dict: A dictionary of connectable channels
         """
-        channels = self.mux.get_channels()
+        topology = self.mux.topology
+        if topology in self._connectable:
+            return self._connectable[topology]
         connectable_channels = defaultdict(list)
         with self.mux:
-            for channel1, channel2 in combinations(channels, 2):
+            channels = self.mux.get_channels()
+            coms = [channel for channel in channels if channel.startswith("com")]
+            if coms:
+                others = [channel for channel in channels if not channel.startswith("com")]
+                pairs = product(others, coms)
+            else:
+                pairs = combinations(channels, 2)
+            for channel1, channel2 in pairs:
                 if self.mux.can_connect(channel1, channel2):
                     connectable_channels[channel1].append(channel2)
                     connectable_channels[channel2].append(channel1)
+        self._connectable[topology] = connectable_channels
         return connectable_channels
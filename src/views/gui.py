@@ -13,6 +13,9 @@ def main(
     config: Optional[Config] = None,
     mock: bool = False,
 ):
+    # Fusion is drawn by Qt itself instead of through the native theme, set
+    # before the application so every widget is created with it
+    QApplication.setStyle("Fusion")
     app = QApplication(sys.argv)
     if config:
         Config.set_instance(config)
@@ -26,11 +26,11 @@ class PlotViewerWidget(FigureCanvas):
         self.x: list[float] = []
         self.y: list[float] = []
 
-        # create an axis
+        # create the axis and the line showing the data, updated in place
         x = np.linspace(0, 2 * np.pi, 100)
         y = np.sin(x)
-        ax = self.figure.add_subplot(111)
-        ax.plot(x, y)
+        self.ax = self.figure.add_subplot(111)
+        (self.line,) = self.ax.plot(x, y)
 
         # show canvas
         super().__init__(self.figure)
@@ -38,12 +38,13 @@ class PlotViewerWidget(FigureCanvas):
     def update_plot(self, x: list[float], y: list[float]):
         self.x = x
         self.y = y
-        ax = self.figure.add_subplot(111)
-        ax.plot(x, y)
+        self.line.set_data(x, y)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.draw_idle()
 
     def clear_plot(self):
         self.x = []
         self.y = []
-        ax = self.figure.add_subplot(111)
-        ax.clear()
-        self.figureCanvas.draw()
+        self.line.set_data([], [])
+        self.draw_idle()
@@ -1,7 +1,10 @@
-from PySide6.QtCore import QObject
-from PySide6.QtWidgets import QMessageBox, QInputDialog
+from PySide6.QtCore import QObject, QTimer
+from PySide6.QtWidgets import QMessageBox, QInputDialog, QLineEdit
 
-from typing import Optional
+from typing import Callable, Optional
+
+# milliseconds a text field has to stay unchanged before its handler is called
+DEBOUNCE_INTERVAL = 150
 
 
 def create_message_box(
@@ -21,3 +24,37 @@ def create_input_dialog(
     dialog.setLabelText(label)
     dialog.exec()
     return dialog.textValue()
+
+
+def connect_debounced(
+    line_edit: QLineEdit,
+    callback: Callable[[str], None],
+    interval: int = DEBOUNCE_INTERVAL,
+) -> QTimer:
+    """Call a handler with the text of a line edit once the user stops typing.
+
+    The handler is called when the text has not changed for interval milliseconds,
+    or right away when editing finishes, e.g. when the field loses focus because a
+    button was clicked.
+
+    Args:
+        line_edit: The line edit to watch
+        callback: Called with the text of the line edit
+        interval: Milliseconds to wait after the last change
+
+    Returns:
+        QTimer: The timer delaying the handler, owned by the line edit
+    """
+    timer = QTimer(line_edit)
+    timer.setSingleShot(True)
+    timer.setInterval(interval)
+    timer.timeout.connect(lambda: callback(line_edit.text()))
+
+    def finish_editing() -> None:
+        if timer.isActive():
+            timer.stop()
+            callback(line_edit.text())
+
+    line_edit.textChanged.connect(lambda _: timer.start())
+    line_edit.editingFinished.connect(finish_editing)
+    return timer
@@ -1,25 +1,58 @@
-from functools import partialmethod, partial
+from functools import partial
 from importlib.resources import files
 from multiprocessing import Queue
 from multiprocessing import Event
-import numpy as np
-from PySide6.QtCore import QFile, QIODevice, QObject
-from PySide6.QtCore import Signal
+from PySide6.QtCore import QBuffer, QByteArray, QFile, QIODevice, QObject
+from PySide6.QtCore import Signal, Slot
 from PySide6.QtUiTools import QUiLoader
-from PySide6.QtWidgets import QTableWidgetItem, QDialogButtonBox, QVBoxLayout
-import PySide6
-import pyqtgraph as pg
-from typing import List, Optional, Tuple, Coroutine
+from PySide6.QtWidgets import QTableWidgetItem, QVBoxLayout
+from typing import Dict, List, Optional, Tuple, Coroutine
 
-from core.event_handling import DataCallBackThread
 from core.experiment import SequentialState
 from core.io import CSVDataCallBack
 from core.utils import CellDataRow, Config
 from view_models.instruments import InstrumentPanelViewModel
 from view_models.subwindows import AddCellSubWindowViewModel
 from view_models.controls import ExperimentControlsViewModel, ContentControlsViewModel
-from view_models.monitoring import MonitorViewModel
-from views.qt.utils import create_message_box
+from views.qt.utils import create_message_box, connect_debounced
+
+
+# Directory of the ui files, resolved once at import
+_UI_DIR = files("views.qt.ui_files")
+# Contents of the ui files that have been loaded, by file name
+_UI_CACHE: Dict[str, QByteArray] = dict()
+# The loader shared by every ui file, created with the first one
+_ui_loader: Optional[QUiLoader] = None
+
+
+def load_ui(name: str) -> QObject:
+    """Build the widgets of a ui file in views.qt.ui_files
+
+    The file is read once, later calls build the widgets from the cached contents.
+    Only call this from the GUI thread, the loader is shared.
+
+    Args:
+        name (str): The name of the ui file
+
+    Returns:
+        QObject: The top level widget of the ui file
+    """
+    global _ui_loader
+    contents = _UI_CACHE.get(name)
+    if contents is None:
+        ui_file = QFile(str(_UI_DIR.joinpath(name)))
+        if not ui_file.open(QIODevice.ReadOnly):
+            raise IOError(f"Failed to open the UI file {name}")
+        try:
+            contents = _UI_CACHE[name] = ui_file.readAll()
+        finally:
+            ui_file.close()
+    buffer = QBuffer()
+    buffer.setData(contents)
+    buffer.open(QIODevice.ReadOnly)
+    if _ui_loader is None:
+        _ui_loader = QUiLoader()
+    return _ui_loader.load(buffer)
 
 
 # region: Add Cell Dialog Builder
@@ -28,45 +61,55 @@ class AddCellDialogBuilder:
 
     @staticmethod
     def build(
-        update_signal: Signal, parent_vm: InstrumentPanelViewModel
+        update_signal: Signal,
+        parent_vm: InstrumentPanelViewModel,
+        dialogs: Optional[Dict[str, QObject]] = None,
     ) -> Optional[QObject]:
-        # load the view from the ui file
-        available_channels = parent_vm.get_channel_connection_display_data()
-        available_channels = [
-            ch for (ch, role) in available_channels if role == "Undefined"
-        ]
-        temp = parent_vm.get_channel_connection_display_data()
-        channels_including_references = []
-        for ch, role in temp:
-            if role == "Undefined":
-                channels_including_references.append(ch)
-            if "Reference" in role:
-                channels_including_references.append(ch)
+        """Build the Add Cell dialog for the topology of the multiplexer.
+
+        Args:
+            update_signal: Emitted when a cell has been added
+            parent_vm: The view model of the instrument panel
+            dialogs: Dialogs built earlier, by ui file. A dialog for the same ui file
+                is cleared and reused, a new one is added.
+
+        Returns:
+            Optional[QObject]: The dialog, None if no reference mode is selected
+        """
         top_name = parent_vm.friendly_topology_name
+        # both dialogs ask for the input and the reference channel of the cell
         match top_name:
             case "Cell Reference":
-                add_cell_ui_file = files("views.qt.ui_files").joinpath(
-                    "cell_reference_add_cell_dialog.ui"
-                )
+                add_cell_ui_file = "cell_reference_add_cell_dialog.ui"
             case "External Reference":
-                add_cell_ui_file = files("views.qt.ui_files").joinpath(
-                    "multi_reference_add_cell_dialog.ui"
-                )
+                add_cell_ui_file = "multi_reference_add_cell_dialog.ui"
             case _:
                 create_message_box("Reference mode is not selected.")
                 return
-        add_cell_ui_file = QFile(str(add_cell_ui_file))
-        if not add_cell_ui_file.open(QIODevice.ReadOnly):
-            raise IOError("Failed to open the Add Cell Dialog UI file")
-        loader = QUiLoader()
-        view = loader.load(add_cell_ui_file)
-        view_model = AddCellSubWindowViewModel(update_signal)
-        update_method = partial(view_model.update_and_exit, view)
-        view.dialogButtonBox.accepted.connect(update_method)
-
-        if hasattr(view, "referenceChannelSelectComboBox"):
-            print(f"Adding references: {channels_including_references}")
-            view.referenceChannelSelectComboBox.addItems(channels_including_references)
+        view = dialogs.get(add_cell_ui_file) if dialogs is not None else None
+        if view is None:
+            # load the view from the ui file
+            view = load_ui(add_cell_ui_file)
+            view_model = AddCellSubWindowViewModel(update_signal)
+            update_method = partial(view_model.update_and_exit, view)
+            view.dialogButtonBox.accepted.connect(update_method)
+            if dialogs is not None:
+                dialogs[add_cell_ui_file] = view
+        else:
+            view.cellNameText.clear()
+            view.channelSelectComboBox.clear()
+            view.referenceChannelSelectComboBox.clear()
+
+        # free channels can be used for anything, reference channels can be shared
+        available_channels = []
+        channels_including_references = []
+        for ch, role in parent_vm.get_channel_connection_display_data():
+            if role == "Undefined":
+                available_channels.append(ch)
+                channels_including_references.append(ch)
+            elif "Reference" in role:
+                channels_including_references.append(ch)
+        view.referenceChannelSelectComboBox.addItems(channels_including_references)
         view.channelSelectComboBox.addItems(available_channels)
         return view
 
@@ -102,15 +145,11 @@ class MainViewBuilder:
         user_event_trigger = Event()
         data_collection_shutdown = Event()
         pause_resume_event = Event()
+        # Read by the data callback thread, which waits on it with a timeout so it
+        # can notice shutdown
         data_queue = Queue()
-        error_queue = Queue()
         # load the view from the ui file
-        main_ui_file = files("views.qt.ui_files").joinpath("main_view.ui")
-        main_ui_file = QFile(str(main_ui_file))
-        if not main_ui_file.open(QIODevice.ReadOnly):
-            raise IOError("Failed to open the MainWindow UI file")
-        loader = QUiLoader()
-        view = loader.load(main_ui_file)
+        view = load_ui("main_view.ui")
 
         # region: Content Control View Model
         content_vm = ContentControlsViewModel(
@@ -123,8 +162,6 @@ class MainViewBuilder:
         view.actionSet_Data_Folder.triggered.connect(content_vm.set_data_folder)
         view.actionFilename_fix.triggered.connect(content_vm.set_filename_fix)
 
-        view.actionSweep_VDS.triggered.connect(content_vm.set_vds_sweep_mode)
-        view.actionSweep_VGS.triggered.connect(content_vm.set_vgs_sweep_mode)
         view.actionPt.triggered.connect(content_vm.set_simple_sampling_mode)
         view.actionStableMean.triggered.connect(
             content_vm.set_stable_mean_sampling_mode
@@ -136,8 +173,19 @@ class MainViewBuilder:
             view.sweep_controls_label,
             view.fixed_source_label,
         )
-        view.actionSweep_VDS.triggered.connect(update_sweep_mode)
-        view.actionSweep_VGS.triggered.connect(update_sweep_mode)
+
+        @Slot()
+        def sweep_vds():
+            content_vm.set_vds_sweep_mode()
+            update_sweep_mode()
+
+        @Slot()
+        def sweep_vgs():
+            content_vm.set_vgs_sweep_mode()
+            update_sweep_mode()
+
+        view.actionSweep_VDS.triggered.connect(sweep_vds)
+        view.actionSweep_VGS.triggered.connect(sweep_vgs)
         # endregion: Content Control View Model
         # region: InstrumentPanelViewModel
         # Connect the InstrumentPanel View Model
@@ -146,13 +194,20 @@ class MainViewBuilder:
         # VGS  and VDS Device Selection
         view.refreshDeviceListButton.clicked.connect(view.instr_vm.request_refresh)
 
+        @Slot(list)
         def refresh_items(items: List[str]):
-            view.deviceListWidget.clear()
-            view.deviceListWidget.addItems(items)
+            # repaint the list once it has been refilled
+            view.deviceListWidget.setUpdatesEnabled(False)
+            try:
+                view.deviceListWidget.clear()
+                view.deviceListWidget.addItems(items)
+            finally:
+                view.deviceListWidget.setUpdatesEnabled(True)
 
         instr_vm.devicesChanged.connect(refresh_items)
         view.deviceListWidget.addItems(instr_vm.devices)
 
+        @Slot()
         def push_selected_vds_source():
             item = view.deviceListWidget.currentItem()
             address = str(item.text())
@@ -160,11 +215,13 @@ class MainViewBuilder:
 
         view.selectVDSDeviceButton.clicked.connect(push_selected_vds_source)
 
+        @Slot(str)
         def update_vds_text(text: str) -> None:
             view.vdsSourceText.setText(f"{text} Selected")
 
         instr_vm.vdsSourceChanged.connect(update_vds_text)
 
+        @Slot()
         def push_selected_vgs_source():
             item = view.deviceListWidget.currentItem()
             address = str(item.text())
@@ -172,6 +229,7 @@ class MainViewBuilder:
 
         view.selectVGSDeviceButton.clicked.connect(push_selected_vgs_source)
 
+        @Slot(str)
         def update_vgs_text(text: str) -> None:
             view.vgsSourceText.setText(f"{text} Selected")
 
@@ -185,20 +243,26 @@ class MainViewBuilder:
         view.tableWidget.setHorizontalHeaderLabels(["Channel", "Connection"])
         # Topology Selection
         view.referenceModeButtonGroup.buttonClicked.connect(instr_vm.update_topology)
-        # Populate the table
-        for i, channel in enumerate(channels):
-            view.tableWidget.setItem(i, 0, QTableWidgetItem(channel))
-            view.tableWidget.setItem(i, 1, QTableWidgetItem("Undefined"))
+        # Populate the table, signals and repaints are held until every row is set
+        view.tableWidget.setUpdatesEnabled(False)
+        view.tableWidget.blockSignals(True)
+        try:
+            for i, channel in enumerate(channels):
+                view.tableWidget.setItem(i, 0, QTableWidgetItem(channel))
+                view.tableWidget.setItem(i, 1, QTableWidgetItem("Undefined"))
+        finally:
+            view.tableWidget.blockSignals(False)
+            view.tableWidget.setUpdatesEnabled(True)
         update_table_connection = partial(instr_vm.update_table, view.tableWidget)
         instr_vm.tableChanged.connect(update_table_connection)
-        content_vm.trigger_reload.connect(update_table_connection)
 
+        @Slot()
         def reload_gpib_device_texts():
-            view.vdsSourceText.setText(Config.get_instance().vds_address)
-            view.vgsSourceText.setText(Config.get_instance().vgs_address)
-
-        content_vm.trigger_reload.connect(reload_gpib_device_texts)
+            config = Config.get_instance()
+            view.vdsSourceText.setText(config.vds_address)
+            view.vgsSourceText.setText(config.vgs_address)
 
+        @Slot()
         def reload_radio_buttons():
             # block signals to prevent the signal from being emitted
             view.referenceModeButtonGroup.blockSignals(True)
@@ -210,11 +274,14 @@ class MainViewBuilder:
                 view.externalReferenceRadio.setChecked(True)
             view.referenceModeButtonGroup.blockSignals(False)
 
-        content_vm.trigger_reload.connect(reload_radio_buttons)
+        # Cell Wiring dialogs, built on the first click and reused afterwards
+        add_cell_dialogs: Dict[str, QObject] = dict()
 
-        # Cell Wiring dialogs
+        @Slot()
         def connect_dialog_view_model():
-            dialog_view = AddCellDialogBuilder.build(instr_vm.tableChanged, instr_vm)
+            dialog_view = AddCellDialogBuilder.build(
+                instr_vm.tableChanged, instr_vm, add_cell_dialogs
+            )
             if dialog_view is None:
                 return
             view.dialog = dialog_view
@@ -240,34 +307,35 @@ class MainViewBuilder:
         experiment_name_text_control = partial(
             exp_vm.set_experiment_name, view.experimentNameText
         )
-        view.experimentNameText.textChanged.connect(experiment_name_text_control)
+        # the text fields update the config once the user stops typing
+        connect_debounced(view.experimentNameText, experiment_name_text_control)
         drain_text_control = partial(exp_vm.set_drain_voltage, view.drainVoltageText)
-        view.drainVoltageText.textChanged.connect(drain_text_control)
+        connect_debounced(view.drainVoltageText, drain_text_control)
         start_text_control = partial(exp_vm.set_gate_start_voltage, view.gateStartText)
-        view.gateStartText.textChanged.connect(start_text_control)
+        connect_debounced(view.gateStartText, start_text_control)
         stop_text_control = partial(exp_vm.set_gate_end_voltage, view.gateStopText)
-        view.gateStopText.textChanged.connect(stop_text_control)
+        connect_debounced(view.gateStopText, stop_text_control)
         step_text_control = partial(exp_vm.set_gate_voltage_step, view.gateStepText)
-        view.gateStepText.textChanged.connect(step_text_control)
+        connect_debounced(view.gateStepText, step_text_control)
         stability_text_control = partial(
             exp_vm.set_stability_threshold, view.stabilityThresholdText
         )
         stability_wait_control = partial(
            exp_vm.set_stability_wait_time, view.stabilityWaitTimeInput
         )
-        view.stabilityWaitTimeInput.textChanged.connect(stability_wait_control)
-        view.stabilityThresholdText.textChanged.connect(stability_text_control)
+        connect_debounced(view.stabilityWaitTimeInput, stability_wait_control)
+        connect_debounced(view.stabilityThresholdText, stability_text_control)
 
         view.numSweepsSpin.valueChanged.connect(exp_vm.set_num_sweeps)
 
         ids_current_limit_text_control = partial(
             exp_vm.set_ids_current_limit, view.idsCurrentLimitText
         )
-        view.idsCurrentLimitText.textChanged.connect(ids_current_limit_text_control)
+        connect_debounced(view.idsCurrentLimitText, ids_current_limit_text_control)
         ig_current_limit_text_control = partial(
             exp_vm.set_igs_current_limit, view.igCurrentLimitText
         )
-        view.igCurrentLimitText.textChanged.connect(ig_current_limit_text_control)
+        connect_debounced(view.igCurrentLimitText, ig_current_limit_text_control)
 
         reload_experiment_controls = partial(
             exp_vm.reload_from_config,
@@ -282,13 +350,28 @@ class MainViewBuilder:
             view.stabilityThresholdText,
             view.stabilityWaitTimeInput,
         )
-        content_vm.trigger_reload.connect(reload_experiment_controls)
+
+        # one handler for everything shown from a loaded config, in a fixed order
+        @Slot()
+        def reload_from_config():
+            update_table_connection()
+            reload_gpib_device_texts()
+            reload_radio_buttons()
+            reload_experiment_controls()
+
+        content_vm.trigger_reload.connect(reload_from_config)
         pause_resume_callback = partial(
             exp_vm.pause_resume_experiment, view.pauseExperimentButton
         )
         view.startExperimentButton.clicked.connect(exp_vm.start_experiment)
-        view.stopExperimentButton.clicked.connect(exp_vm.stop_experiment)
-        view.stopExperimentButton.clicked.connect(exp_vm.user_event_trigger.set)
+
+        @Slot()
+        def stop_experiment():
+            exp_vm.stop_experiment()
+            # wake the experiment if it is waiting for the user so it sees the stop
+            exp_vm.user_event_trigger.set()
+
+        view.stopExperimentButton.clicked.connect(stop_experiment)
         view.pauseExperimentButton.clicked.connect(pause_resume_callback)
         user_trigger_control = partial(
             exp_vm.handle_user_trigger, view.readyUserTrigger
@@ -300,7 +383,10 @@ class MainViewBuilder:
         )
         exp_vm.waitStateReceived.connect(wait_received_control)
         exp_vm.start_trigger.connect(exp_vm.handle_start_signal)
-        # Plot Viewer
+        # Plot Viewer, pyqtgraph is only imported once the main view is built
+        import pyqtgraph as pg
+        from view_models.monitoring import MonitorViewModel
+
         pg.setConfigOption("background", "w")
         pg.setConfigOption("foreground", "k")
         plot_widget = pg.PlotWidget(
@@ -317,7 +403,6 @@ class MainViewBuilder:
         update_state = partial(
             plotview_vm.update_current_state_text, view.experimentStateText
         )
-        plotview_vm.update_plot_signal.connect(plotview_vm.update_data)
         plotview_vm.update_latest_text.connect(update_text)
         plotview_vm.update_percentage_complete.connect(view.progressBar.setValue)
         plotview_vm.update_current_state.connect(update_state)
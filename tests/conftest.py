@@ -1,9 +1,11 @@
+import copy
+
 import pytest
 
 from core.utils import Config
 
-@pytest.fixture
-def sample_config():
+@pytest.fixture(scope="session")
+def _sample_config_proto():
     # Create a sample configuration
     experiment_name = "Sample Experiment"
     vgs_address = "192.168.1.1"
@@ -11,12 +13,9 @@ def sample_config():
     start_voltage = 0.0
     end_voltage = 5.0
     voltage_step = 1.0
-    min_delay = 0.1
-    cells = {
-        "Cell1": ["A1", "B1", "C1"],
-        "Cell2": ["A2", "B2", "C2"],
-        "Cell3": ["A3", "B3", "C3"]
-    }
+    cell_names = ["Cell1", "Cell2", "Cell3"]
+    cell_channel_mapping = {"Cell1": "CH1", "Cell2": "CH2", "Cell3": "CH3"}
+    reference_channel_mapping = {"Cell1": "CH9", "Cell2": "CH9", "Cell3": "CH10"}
 
     # Create a Config instance
     config = Config(
@@ -26,8 +25,15 @@ def sample_config():
         start_voltage=start_voltage,
         end_voltage=end_voltage,
         voltage_step=voltage_step,
-        min_delay=min_delay,
-        cells=cells
+        cell_names=cell_names,
+        cell_channel_mapping=cell_channel_mapping,
+        reference_channel_mapping=reference_channel_mapping,
     )
 
-    return config
\ No newline at end of file
+    return config
+
+
+@pytest.fixture
+def sample_config(_sample_config_proto):
+    # Config holds mutable mappings, so every test gets its own copy
+    return copy.deepcopy(_sample_config_proto)
\ No newline at end of file
@@ -0,0 +1,60 @@
+from multiprocessing import Event, Queue
+
+import numpy as np
+
+from core import event_handling
+from core.event_handling import DataCallBackThread
+from core.experiment import CELL_DATA_DTYPE, STATE_CODES, SequentialState
+
+
+class RecordingCallBack:
+    def __init__(self):
+        self.rows = []
+        self.finalized = False
+
+    def __call__(self, data):
+        self.rows.append(data)
+
+    def finalize(self):
+        self.finalized = True
+
+
+def make_batch(start, count):
+    batch = np.zeros(count, dtype=CELL_DATA_DTYPE)
+    batch["time_ns"] = np.arange(start, start + count) * 1_000_000
+    batch["state"] = STATE_CODES[SequentialState.cell_sweep]
+    batch["vgs_index"] = np.arange(start, start + count)
+    return batch
+
+
+def test_sentinel_ends_the_thread():
+    queue = Queue()
+    callback = RecordingCallBack()
+    thread = DataCallBackThread(
+        queue, Event(), {SequentialState.cell_sweep: [callback]}, batch_size=8
+    )
+    for start in range(0, 100, 10):
+        queue.put(make_batch(start, 10))
+    queue.put(None)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert [row.vgs_index for row in callback.rows] == list(range(100))
+    assert callback.finalized
+
+
+def test_shutdown_without_sentinel_ends_the_thread(monkeypatch):
+    monkeypatch.setattr(event_handling, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(event_handling, "SHUTDOWN_GRACE_PERIOD", 0.2)
+    queue = Queue()
+    shutdown = Event()
+    callback = RecordingCallBack()
+    thread = DataCallBackThread(queue, shutdown, {SequentialState.cell_sweep: [callback]})
+    thread.start()
+    queue.put(make_batch(0, 5))
+    # the producer stops without sending None
+    shutdown.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(callback.rows) == 5
+    assert callback.finalized
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from core import io
+from core.io import CSVDataCallBack
+from core.utils import CellDataRow, Config
+
+
+@pytest.fixture
+def csv_config(sample_config, tmp_path, monkeypatch):
+    # the callback writes to the data root of the shared config
+    sample_config.data_root = str(tmp_path)
+    monkeypatch.setattr(Config, "_instance", sample_config)
+    return sample_config
+
+
+@pytest.fixture(params=[True, False], ids=["writev", "write"])
+def has_writev(request, monkeypatch):
+    if request.param and not hasattr(os, "writev"):
+        pytest.skip("os.writev is not available")
+    monkeypatch.setattr(io, "_HAS_WRITEV", request.param)
+    return request.param
+
+
+def make_rows(cell_index, sweep_index, count, start=0):
+    return [
+        CellDataRow(
+            time=(start + i) * 0.1,
+            state="Sweeping Cell",
+            vgs_index=start + i,
+            cell_index=cell_index,
+            sweep_index=sweep_index,
+            drain_voltage=0.5,
+            gate_voltage=(start + i) / 7,
+            drain_current=1e-9 * (start + i + 1) / 3,
+        )
+        for i in range(count)
+    ]
+
+
+def text_mode_output(rows):
+    # what writing the joined values to a text mode file produces
+    lines = [",".join(CellDataRow.HEADER)]
+    for row in rows:
+        values = (row.time, row.drain_voltage, row.gate_voltage, row.drain_current)
+        lines.append(",".join(map(str, values)))
+    return ("\n".join(lines) + "\n").replace("\n", os.linesep).encode()
+
+
+def read_data_file(config, cell_index, sweep_index):
+    cell_name = config.cell_names[cell_index]
+    return (config.data_path / f"{config.experiment_name}_{cell_name}_{sweep_index}.csv").read_bytes()
+
+
+def test_rows_match_text_mode_output(csv_config, has_writev):
+    first = make_rows(0, 0, 50)
+    second = make_rows(1, 0, 30)
+    # a small buffer splits each file into many writes
+    callback = CSVDataCallBack(buffer_size=64)
+    for row in first + second:
+        callback(row)
+    callback.finalize()
+    assert read_data_file(csv_config, 0, 0) == text_mode_output(first)
+    assert read_data_file(csv_config, 1, 0) == text_mode_output(second)
+
+
+def test_call_batch_matches_rows(csv_config, has_writev):
+    rows = make_rows(0, 0, 40) + make_rows(0, 1, 40) + make_rows(2, 1, 5)
+    callback = CSVDataCallBack(buffer_size=100)
+    for start in range(0, len(rows), 16):
+        callback.call_batch(rows[start : start + 16])
+    callback.finalize()
+    assert read_data_file(csv_config, 0, 0) == text_mode_output(rows[:40])
+    assert read_data_file(csv_config, 0, 1) == text_mode_output(rows[40:80])
+    assert read_data_file(csv_config, 2, 1) == text_mode_output(rows[80:])
+
+
+def test_continued_sweep_is_appended(csv_config, has_writev):
+    first = make_rows(0, 0, 20)
+    other = make_rows(1, 0, 20)
+    rest = make_rows(0, 0, 20, start=20)
+    callback = CSVDataCallBack(buffer_size=64)
+    # starting the second file closes the first, which is then opened again
+    for row in first + other + rest:
+        callback(row)
+    callback.finalize()
+    assert read_data_file(csv_config, 0, 0) == text_mode_output(first + rest)
+    assert read_data_file(csv_config, 1, 0) == text_mode_output(other)
+
+
+def test_close_waits_for_queued_writes(tmp_path, has_writev):
+    callback = CSVDataCallBack()
+    closed = os.open(tmp_path / "closed.csv", io._OPEN_FLAGS, 0o644)
+    kept = os.open(tmp_path / "kept.csv", io._OPEN_FLAGS, 0o644)
+    # the writer takes all of these at once, the close comes between writes
+    for request in [
+        (closed, bytearray(b"a,")),
+        (kept, bytearray(b"x,")),
+        (closed, bytearray(b"b")),
+        (closed, None),
+        (kept, bytearray(b"y")),
+        None,
+    ]:
+        callback._write_q.put(request)
+    callback._writer_loop()
+    with pytest.raises(OSError):
+        os.fstat(closed)
+    os.close(kept)
+    assert (tmp_path / "closed.csv").read_bytes() == b"a,b"
+    assert (tmp_path / "kept.csv").read_bytes() == b"x,y"
+
+
+@pytest.mark.skipif(not hasattr(os, "writev"), reason="os.writev is not available")
+def test_partial_writev_is_completed(tmp_path, monkeypatch):
+    def short_writev(fd, chunks):
+        # write only part of the data, like a full pipe or disk would
+        return os.write(fd, b"".join(chunks)[:7])
+
+    monkeypatch.setattr(io, "_HAS_WRITEV", True)
+    monkeypatch.setattr(os, "writev", short_writev)
+    fd = os.open(tmp_path / "data.csv", io._OPEN_FLAGS, 0o644)
+    chunks = [bytearray(b"hello "), bytearray(b"world"), bytearray(b"!")]
+    CSVDataCallBack._write_chunks(fd, chunks)
+    os.close(fd)
+    assert (tmp_path / "data.csv").read_bytes() == b"hello world!"
+    assert not any(chunks)
@@ -1,7 +1,79 @@
-from core.utils import Config
+import json
+
+import pytest
+
+from core import utils
+from core.utils import Config, bidict
 
 def test_config_loading(sample_config):
     # assert that the config can be written and read from json
     json_str = sample_config.to_json()
     loaded_config = Config.from_json(json_str)
-    assert loaded_config == sample_config
\ No newline at end of file
+    assert loaded_config == sample_config
+
+
+def test_config_loading_without_orjson(sample_config, monkeypatch):
+    # the json module is used when orjson is not installed
+    monkeypatch.setattr(utils, "_json_dumps", json.dumps)
+    monkeypatch.setattr(utils, "_json_loads", json.loads)
+    json_str = sample_config.to_json()
+    loaded_config = Config.from_json(json_str)
+    assert loaded_config == sample_config
+
+
+def test_config_loading_with_orjson(sample_config, monkeypatch):
+    orjson = pytest.importorskip("orjson")
+    monkeypatch.setattr(utils, "_json_dumps", lambda obj: orjson.dumps(obj).decode())
+    monkeypatch.setattr(utils, "_json_loads", orjson.loads)
+    json_str = sample_config.to_json()
+    loaded_config = Config.from_json(json_str)
+    assert loaded_config == sample_config
+    # configs saved by either encoder can be read by the other
+    assert Config.from_json(json.dumps(json.loads(json_str))) == sample_config
+
+
+def test_bidict_inverse():
+    mapping = bidict(Cell1="CH1", Cell2="CH2", Cell3="CH1")
+    # the keys of each value are kept in insertion order
+    assert list(mapping.inverse["CH1"]) == ["Cell1", "Cell3"]
+    assert list(mapping.inverse["CH2"]) == ["Cell2"]
+    assert mapping.inverse_last("CH1") == "Cell3"
+    assert mapping.inverse_last("CH3", "missing") == "missing"
+
+
+def test_bidict_reassign_key():
+    mapping = bidict(Cell1="CH1", Cell2="CH1")
+    mapping["Cell1"] = "CH2"
+    assert list(mapping.inverse["CH1"]) == ["Cell2"]
+    assert list(mapping.inverse["CH2"]) == ["Cell1"]
+    mapping["Cell2"] = "CH2"
+    assert not mapping.inverse.get("CH1")
+    assert mapping.inverse_last("CH1") is None
+    assert mapping.inverse_last("CH2") == "Cell2"
+    # mapping a key to its value again makes it the most recent key
+    mapping["Cell1"] = "CH2"
+    assert list(mapping.inverse["CH2"]) == ["Cell2", "Cell1"]
+    assert mapping.inverse_last("CH2") == "Cell1"
+
+
+def test_bidict_delete_key():
+    mapping = bidict(Cell1="CH1", Cell2="CH1", Cell3="CH2")
+    del mapping["Cell2"]
+    assert list(mapping.inverse["CH1"]) == ["Cell1"]
+    del mapping["Cell3"]
+    assert "CH2" not in mapping.inverse
+    assert mapping.inverse_last("CH2") is None
+    assert mapping == {"Cell1": "CH1"}
+
+
+def test_bidict_copy():
+    original = bidict(Cell1="CH1", Cell2="CH1")
+    copy = bidict(original)
+    assert copy == original
+    assert copy.inverse == original.inverse
+    # the copy has its own inverse
+    copy["Cell1"] = "CH2"
+    del copy["Cell2"]
+    assert list(original.inverse["CH1"]) == ["Cell1", "Cell2"]
+    assert "CH2" not in original.inverse
+    assert copy.inverse_last("CH2") == "Cell1"